@@ -0,0 +1,145 @@
+import numpy as np
+
+
+class AudioRing:
+    """
+    Fixed-size circular sample buffer.
+    Every block is written twice (once in each half of a double-length array),
+    so any window of up to `capacity` samples can be returned as a contiguous,
+    zero-copy view no matter where the write position has wrapped to.
+    """
+
+    def __init__(self, capacity, dtype=np.int16):
+        self.capacity = int(capacity)
+        self.dtype = np.dtype(dtype)
+        self._data = np.zeros(2 * self.capacity, dtype=self.dtype)
+        self.written = 0  # total samples ever written (absolute write position)
+
+    def write(self, block):
+        """Append a 1D block of samples, overwriting the oldest ones."""
+        n = len(block)
+        if n == 0:
+            return
+        cap = self.capacity
+
+        # only the newest `capacity` samples can survive anyway
+        if n > cap:
+            self.written += n - cap
+            block = block[-cap:]
+            n = cap
+
+        pos = self.written % cap
+        first = min(n, cap - pos)
+        self._data[pos:pos + first] = block[:first]
+        self._data[pos + cap:pos + cap + first] = block[:first]
+
+        rest = n - first
+        if rest:
+            self._data[:rest] = block[first:]
+            self._data[cap:cap + rest] = block[first:]
+
+        # publish only after the samples are in place
+        self.written += n
+
+    def available_from(self, start):
+        """Oldest absolute sample index still held in the buffer, given a desired start."""
+        return max(start, self.written - self.capacity, 0)
+
+    def view(self, start, length):
+        """
+        Zero-copy view of `length` samples starting at absolute index `start`.
+        The caller must make sure the range has been written and not yet overwritten.
+        """
+        if length > self.capacity:
+            raise ValueError(f"Requested {length} samples from a ring of {self.capacity}")
+        offset = start % self.capacity
+        return self._data[offset:offset + length]
+
+    def latest(self, length):
+        """Zero-copy view of the most recent `length` samples (fewer if not yet written)."""
+        length = min(int(length), self.written, self.capacity)
+        return self.view(self.written - length, length)
+
+    def clear(self):
+        self.written = 0
+
+
+class RecordingBuffer:
+    """
+    Preallocated float32 buffer for a single command recording, with a hard size limit.
+    What happens when it fills up is set by `overflow`:
+    - "stop": refuse further audio (the recorder should end the recording)
+    - "keep_latest": keep recording, discarding the oldest audio. The samples then go
+      into a mirrored AudioRing, so dropping old audio moves nothing and the latest
+      `limit` samples are still one contiguous view.
+    The recorded audio is handed out as a view, not a copy.
+    """
+
+    OVERFLOW_POLICIES = ("stop", "keep_latest")
+
+    def __init__(self, max_samples, overflow="stop"):
+        self.capacity = int(max_samples)
+        self._data = np.zeros(self.capacity, dtype=np.float32)
+        self._ring = None  # keep_latest storage, created on first use and reused while the limit is the same
+        self._scratch = np.zeros(0, dtype=np.float32)
+        self.reset(overflow=overflow)
+
+    def reset(self, max_samples=None, overflow=None):
+        """
+        Start a new recording. `max_samples` can lower the limit for this
+        recording (it never grows past the preallocated capacity).
+        """
+        if overflow is not None:
+            if overflow not in self.OVERFLOW_POLICIES:
+                raise ValueError(f"Unknown overflow policy: {overflow} (expected one of {self.OVERFLOW_POLICIES})")
+            self.overflow = overflow
+        self.limit = self.capacity if max_samples is None else min(int(max_samples), self.capacity)
+        self.length = 0
+        self.dropped = 0  # samples discarded or refused because the buffer was full
+        if self.overflow == "keep_latest":
+            if self._ring is None or self._ring.capacity != self.limit:
+                self._ring = AudioRing(self.limit, dtype=np.float32)
+            self._ring.clear()
+
+    @property
+    def full(self):
+        return self.length >= self.limit
+
+    def append(self, block, scale=1.0):
+        """
+        Append a 1D block (int16 input can be scaled to float with scale=1/32768).
+        Returns a view of the samples that were written, so callers can
+        compute levels without another conversion.
+        """
+        n = len(block)
+        if n > self.limit:
+            self.dropped += n - self.limit
+            block = block[-self.limit:]
+            n = self.limit
+
+        if self.overflow == "keep_latest":
+            # scale into scratch space, then one block write into the ring; the oldest audio is simply overwritten
+            if len(self._scratch) < n:
+                self._scratch = np.zeros(n, dtype=np.float32)
+            np.multiply(block, scale, out=self._scratch[:n], casting="unsafe")
+            self._ring.write(self._scratch[:n])
+            self.dropped += max(0, self.length + n - self.limit)
+            self.length = min(self.length + n, self.limit)
+            return self._ring.latest(n)
+
+        free = self.limit - self.length
+        if n > free:
+            self.dropped += n - free
+            block = block[:free]
+            n = free
+
+        dest = self._data[self.length:self.length + n]
+        np.multiply(block, scale, out=dest, casting="unsafe")
+        self.length += n
+        return dest
+
+    def view(self):
+        """Zero-copy view of everything recorded so far."""
+        if self.overflow == "keep_latest":
+            return self._ring.latest(self.length)
+        return self._data[:self.length]
@@ -0,0 +1,215 @@
+import threading
+import time
+import numpy as np
+import sounddevice as sd
+import soundfile as sf
+from audio_buffers import AudioRing
+
+
+class AudioSource:
+    """
+    What the capture code reads from. Anything with a `samplerate`,
+    read(frames) -> (data, overflowed) returning (frames, 1) int16 like
+    sd.InputStream.read(), and skip_to_latest() can drive wake word detection
+    and recording: the live CaptureReader, or a FileAudioSource for replay.
+    """
+
+    samplerate = None
+
+    def read(self, frames):
+        raise NotImplementedError()
+
+    def skip_to_latest(self):
+        """Discard audio that arrived while nobody was reading."""
+        pass
+
+    def close(self):
+        pass
+
+
+class AudioCapture:
+    """
+    One long-lived input stream for the whole session.
+    A PortAudio callback copies every incoming block into a shared ring buffer,
+    so capture never stops between turns and the device is only opened once.
+    Consumers (wake word, recording) get their own CaptureReader and read from the ring.
+    """
+
+    def __init__(self, device=None, samplerate=16000, buffer_seconds=5.0, blocksize=0):
+        self.device = device
+        self.samplerate = int(samplerate)
+        self.blocksize = blocksize
+        self.ring = AudioRing(int(buffer_seconds * self.samplerate), dtype=np.int16)
+        self.input_overflows = 0  # overflows reported by PortAudio itself
+        self._cond = threading.Condition()
+        self._stream = None
+
+    def start(self):
+        if self._stream is not None:
+            return
+        self._stream = sd.InputStream(
+            samplerate=self.samplerate,
+            channels=1,
+            dtype="int16",
+            device=self.device,
+            blocksize=self.blocksize,
+            callback=self._callback,
+        )
+        self._stream.start()
+
+    def close(self):
+        if self._stream is None:
+            return
+        try:
+            self._stream.stop()
+            self._stream.close()
+        finally:
+            # even if PortAudio errors (e.g. the device is already gone), readers must stop waiting
+            self._stream = None
+            with self._cond:
+                self._cond.notify_all()
+
+    @property
+    def active(self):
+        return self._stream is not None and self._stream.active
+
+    def reader(self):
+        """Return a new reader positioned at the current end of the ring."""
+        return CaptureReader(self)
+
+    def _callback(self, indata, frames, time_info, status):
+        # runs on the PortAudio thread: copy and notify, nothing else
+        if status.input_overflow:
+            self.input_overflows += 1
+        self.ring.write(indata[:, 0])
+        with self._cond:
+            self._cond.notify_all()
+
+
+class CaptureReader(AudioSource):
+    """
+    A cursor into an AudioCapture ring buffer.
+    read() mirrors sd.InputStream.read(): it blocks until `frames` samples are
+    available and returns (data, overflowed) with data shaped (frames, 1) int16.
+    The returned array is a scratch buffer owned by the reader and is reused
+    on the next read, so copy it if it needs to outlive the call.
+    """
+
+    def __init__(self, capture, timeout=2.0, stall_seconds=5.0):
+        self.capture = capture
+        self.samplerate = capture.samplerate
+        self.timeout = timeout
+        self.stall_seconds = stall_seconds  # no audio for this long means the device is gone
+        self.cursor = capture.ring.written
+        self.overflows = 0  # times this reader fell more than a full ring behind
+        self._scratch = np.zeros((0, 1), dtype=np.int16)
+
+    def skip_to_latest(self):
+        """Drop anything not yet read (e.g. audio captured while HAL was busy talking)."""
+        self.cursor = self.capture.ring.written
+
+    def read(self, frames):
+        ring = self.capture.ring
+        with self.capture._cond:
+            waited_since = None
+            while ring.written - self.cursor < frames:
+                if not self.capture.active:
+                    raise RuntimeError("Audio capture stream is not running")
+                # an unplugged USB device can leave the stream "active" with the callback silent
+                written = ring.written
+                self.capture._cond.wait(timeout=self.timeout)
+                if ring.written != written:
+                    waited_since = None
+                elif waited_since is None:
+                    waited_since = time.monotonic()
+                elif time.monotonic() - waited_since >= self.stall_seconds:
+                    raise RuntimeError(f"No audio from the capture device for {self.stall_seconds:.0f}s")
+
+        overflowed = False
+        oldest = ring.available_from(self.cursor)
+        if oldest > self.cursor:
+            overflowed = True
+            self.cursor = oldest
+
+        if len(self._scratch) < frames:
+            self._scratch = np.zeros((frames, 1), dtype=np.int16)
+        out = self._scratch[:frames]
+        out[:, 0] = ring.view(self.cursor, frames)
+
+        # the callback may have lapped us while we were copying
+        if ring.written - self.cursor > ring.capacity:
+            overflowed = True
+
+        if overflowed:
+            self.overflows += 1
+        self.cursor += frames
+        return out, overflowed
+
+
+class FileAudioSource(AudioSource):
+    """
+    Plays a WAV/FLAC file into the capture code instead of a microphone.
+    - realtime=True paces read() like a live stream (and skip_to_latest() jumps
+      ahead to "now", as it would on a device); realtime=False returns as fast as possible.
+    - After the file ends, `tail_padding` seconds of silence are returned so
+      endpointing can finish, then read() raises EOFError.
+    `position` is the current read position in seconds of audio, which makes
+    trigger and endpoint latencies measurable and deterministic.
+    """
+
+    def __init__(self, path, realtime=False, tail_padding=2.0):
+        self.path = path
+        self.realtime = realtime
+        self._file = sf.SoundFile(path)
+        self.samplerate = self._file.samplerate
+        self.channels = self._file.channels
+        self.tail_padding = int(tail_padding * self.samplerate)
+        self.samples_read = 0
+        self._padding_left = self.tail_padding
+        self._start_time = None
+        self._raw = np.zeros((0, self.channels), dtype=np.int16)
+        self._out = np.zeros((0, 1), dtype=np.int16)
+
+    @property
+    def position(self):
+        return self.samples_read / self.samplerate
+
+    def skip_to_latest(self):
+        # in real time the "live" position is wherever the clock says we are
+        if self.realtime and self._start_time is not None:
+            behind = int((time.time() - self._start_time) * self.samplerate) - self.samples_read
+            if behind > 0:
+                self._file.seek(min(self._file.tell() + behind, self._file.frames))
+                self.samples_read += behind
+
+    def read(self, frames):
+        if self._start_time is None:
+            self._start_time = time.time()
+
+        if len(self._out) < frames:
+            self._raw = np.zeros((frames, self.channels), dtype=np.int16)
+            self._out = np.zeros((frames, 1), dtype=np.int16)
+        out = self._out[:frames]
+
+        got = len(self._file.read(frames, dtype="int16", always_2d=True, out=self._raw[:frames]))
+        if got and self.channels == 1:
+            out[:got, 0] = self._raw[:got, 0]
+        elif got:
+            out[:got, 0] = self._raw[:got].mean(axis=1)
+
+        # past the end of the file: silence, then EOF
+        if got < frames:
+            if self._padding_left <= 0:
+                raise EOFError(f"End of {self.path}")
+            out[got:] = 0
+            self._padding_left -= frames - got
+
+        self.samples_read += frames
+        if self.realtime:
+            wait = self._start_time + self.samples_read / self.samplerate - time.time()
+            if wait > 0:
+                time.sleep(wait)
+        return out, False
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,129 @@
+import platform
+import threading
+import logging
+import sounddevice as sd
+
+SYSTEM = platform.system()
+
+logger = logging.getLogger('HAL')
+
+
+def restart_portaudio():
+    """
+    Re-initialize PortAudio so its device list is re-enumerated (PortAudio only scans at init).
+    sounddevice has no public API for this; _terminate()/_initialize() are the functions it runs
+    at import and exit. They are only called here, with every stream closed, and if a sounddevice
+    release drops them we keep the old device list instead of failing.
+    """
+    terminate = getattr(sd, "_terminate", None)
+    initialize = getattr(sd, "_initialize", None)
+    if terminate is None or initialize is None:
+        logger.warning("This sounddevice version can't restart PortAudio – newly plugged devices need a HAL restart")
+        return
+    terminate()
+    initialize()
+
+
+class AudioDeviceRegistry:
+    """
+    Picks the input and output devices once at startup and remembers them.
+    For each pick it probes whether the device opens natively at the rate we
+    actually need (16kHz for capture, the TTS model's rate for playback), so
+    no resampling is needed when the hardware supports it.
+    The device list is only re-queried when a device change is detected.
+    """
+
+    def __init__(self, capture_rate=16000, playback_rate=22050, playback_channels=2):
+        self.capture_rate = int(capture_rate)
+        self.playback_rate = int(playback_rate)
+        self.playback_channels = playback_channels
+        self._lock = threading.Lock()
+        self._input = None
+        self._output = None
+        self._signature = None
+        self.refresh()
+
+    # ---------------- public API ----------------
+    def input(self):
+        """(device, samplerate) for the capture stream."""
+        return self._input
+
+    def output(self):
+        """(device, samplerate) for playback."""
+        return self._output
+
+    def changed(self):
+        """Cheap check for hotplug: True if the set of sound cards differs from the last refresh."""
+        signature = self._read_signature()
+        return signature is not None and signature != self._signature
+
+    def refresh(self, reinitialize=False):
+        """
+        Re-scan devices and re-probe rates.
+        reinitialize=True restarts PortAudio so newly plugged devices show up;
+        all streams must be closed before doing that.
+        """
+        with self._lock:
+            if reinitialize:
+                restart_portaudio()
+            devices = sd.query_devices()
+            self._input = self._pick(devices, "input")
+            self._output = self._pick(devices, "output")
+            self._signature = self._read_signature()
+        return self._input, self._output
+
+    def describe(self):
+        def name(device):
+            return "default" if device is None else sd.query_devices(device)["name"]
+        return (f"input: {name(self._input[0])} @ {self._input[1]} Hz, "
+                f"output: {name(self._output[0])} @ {self._output[1]} Hz")
+
+    # ---------------- internals ----------------
+    def _pick(self, devices, kind):
+        if kind == "input":
+            if SYSTEM == "Linux":
+                # pick USB mic if available, else the first input device
+                device = self._find(devices, "max_input_channels", ("Microphone", "USB"))
+            else:
+                # macOS/Windows: use default device
+                device = None
+            return device, self._negotiate(device, kind, self.capture_rate, channels=1, dtype="int16")
+        else:
+            if SYSTEM == "Linux":
+                # pick USB speaker if available, else the first output device
+                device = self._find(devices, "max_output_channels", ("USB", "Device"))
+            else:
+                # macOS/Windows: default output
+                device = None
+            return device, self._negotiate(device, kind, self.playback_rate, channels=self.playback_channels, dtype="float32")
+
+    @staticmethod
+    def _find(devices, channels_key, name_hints):
+        for i, dev in enumerate(devices):
+            if dev[channels_key] > 0 and any(hint in dev["name"] for hint in name_hints):
+                return i
+        for i, dev in enumerate(devices):
+            if dev[channels_key] > 0:
+                return i
+        return None
+
+    @staticmethod
+    def _negotiate(device, kind, preferred_rate, channels, dtype):
+        """Use preferred_rate if the device accepts it natively, else the device's default rate."""
+        check = sd.check_input_settings if kind == "input" else sd.check_output_settings
+        try:
+            check(device=device, samplerate=preferred_rate, channels=channels, dtype=dtype)
+            return preferred_rate
+        except Exception:
+            return int(sd.query_devices(device, kind)["default_samplerate"])
+
+    @staticmethod
+    def _read_signature():
+        # ALSA lists every card here; reading it is far cheaper than re-initializing PortAudio
+        if SYSTEM == "Linux":
+            try:
+                with open("/proc/asound/cards") as f:
+                    return f.read()
+            except OSError:
+                return None
+        return None
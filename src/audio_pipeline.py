@@ -0,0 +1,230 @@
+import threading
+import queue
+import time
+import numpy as np
+
+
+class CaptureStopped(RuntimeError):
+    """The capture thread has died (e.g. the input device was unplugged); the cause is chained."""
+
+
+class StageStats:
+    """Per-stage counters, reset after each report."""
+
+    def __init__(self, name):
+        self.name = name
+        self.reset()
+
+    def reset(self):
+        self.samples = 0
+        self.busy_time = 0.0  # time spent between reads, i.e. processing frames
+        self.max_busy = 0.0  # longest processing gap for a single read
+        self.max_depth = 0  # deepest the queue got while this stage was reading
+        self.drops = 0  # frames lost while this stage was the consumer
+
+
+class StageReader:
+    """
+    The read(frames) -> (data, overflowed) interface of sd.InputStream, backed by
+    the pipeline's frame queue. Each consumer (wake word, recording...) gets its
+    own reader so its load and drops are reported separately.
+    """
+
+    def __init__(self, pipeline, name):
+        self.pipeline = pipeline
+        self.name = name
+        self.samplerate = pipeline.samplerate
+        self.stats = StageStats(name)
+        self._last_return = None
+
+    def skip_to_latest(self):
+        self.pipeline.drain()
+        self._last_return = None
+
+    def read(self, frames):
+        start = time.time()
+        if self._last_return is not None:
+            busy = start - self._last_return
+            self.stats.busy_time += busy
+            self.stats.max_busy = max(self.stats.max_busy, busy)
+
+        data, dropped = self.pipeline._consume(frames, self)
+        self.stats.samples += frames
+        self.stats.drops += dropped
+        self._last_return = time.time()
+        return data, dropped > 0
+
+    def idle(self):
+        """Call when the stage stops reading, so the gap until it resumes isn't counted as processing."""
+        self._last_return = None
+
+
+class AudioPipeline:
+    """
+    Producer/consumer audio pipeline.
+    A dedicated capture thread reads fixed-size frames from `source` (any
+    read(frames) -> (data, overflowed) object, e.g. a ResampledReader) and pushes
+    them into a bounded queue, so slow consumers (Porcupine, logging, VAD)
+    never stall capture. When the queue is full the oldest frame is dropped and
+    counted against whichever stage is currently consuming.
+    With backpressure=True (a source that can wait, e.g. a file replayed faster
+    than real time) the capture thread blocks on a full queue instead, and
+    drain() keeps the queued frames, so no audio is ever skipped.
+    Frames live in a preallocated pool; the queue only carries slot numbers.
+    """
+
+    def __init__(self, source, frame_length=512, frame_queue=None, queue_frames=64, backpressure=False):
+        self.source = source
+        self.backpressure = backpressure
+        self.samplerate = int(source.samplerate)
+        self.frame_length = frame_length
+        self.queue = frame_queue if frame_queue is not None else queue.Queue(maxsize=queue_frames)
+        if self.queue.maxsize <= 0:
+            raise ValueError("AudioPipeline needs a bounded queue")
+
+        # a few spare slots so the producer never writes a slot that is still queued or being copied out
+        self._pool = np.zeros((self.queue.maxsize + 4, frame_length), dtype=np.int16)
+        self._seq = 0
+
+        self._leftover = np.zeros(0, dtype=np.int16)  # part of a frame not yet handed to a reader
+        self._out = np.zeros((0, 1), dtype=np.int16)
+        self._active = None  # the stage currently reading, if any
+        self._pending_drops = 0  # drops not yet reported to the active stage
+        self._drops_lock = threading.Lock()
+        self.produced = 0
+        self.idle_discards = 0  # frames dropped while no stage was listening (not a problem)
+        self.source_overflows = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._capture_loop, name="audio-capture", daemon=True)
+        self._error = None
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def failed(self):
+        """True if the capture thread died on an error (not stopped on purpose)."""
+        return self._error is not None and not self._thread.is_alive()
+
+    def join(self, timeout=None):
+        """Wait for the capture thread to exit (close the source first if it may be blocked reading)."""
+        self._thread.join(timeout)
+
+    def reader(self, name):
+        return StageReader(self, name)
+
+    def drain(self):
+        """Throw away everything queued (e.g. audio captured while HAL was talking)."""
+        if self.backpressure:
+            return  # nothing queued is stale: the source waited for us
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+        self._leftover = self._leftover[:0]
+        with self._drops_lock:
+            self._pending_drops = 0
+
+    # ---------------- producer ----------------
+    def _capture_loop(self):
+        try:
+            while not self._stop.is_set():
+                data, overflowed = self.source.read(self.frame_length)
+                if overflowed:
+                    self.source_overflows += 1
+                    with self._drops_lock:
+                        self._pending_drops += 1
+
+                slot = self._seq % len(self._pool)
+                self._pool[slot] = data[:, 0]
+                self._seq += 1
+                self.produced += 1
+
+                while self.backpressure and not self._stop.is_set():
+                    try:
+                        self.queue.put(slot, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                while not self.backpressure:
+                    try:
+                        self.queue.put_nowait(slot)
+                        break
+                    except queue.Full:
+                        try:
+                            self.queue.get_nowait()
+                        except queue.Empty:
+                            continue
+                        if self._active is None:
+                            self.idle_discards += 1
+                        else:
+                            with self._drops_lock:
+                                self._pending_drops += 1
+        except Exception as e:
+            self._error = e
+
+    # ---------------- consumer ----------------
+    def _next_frame(self):
+        while True:
+            try:
+                return self._pool[self.queue.get(timeout=1.0)]
+            except queue.Empty:
+                if not self._thread.is_alive():
+                    raise CaptureStopped(f"Audio capture thread stopped: {self._error}") from self._error
+
+    def _consume(self, frames, stage):
+        if self._active is not stage:
+            # a new stage takes over; drops before this point weren't its fault
+            if self._active is not None:
+                self._active.idle()
+            self._active = stage
+            with self._drops_lock:
+                self._pending_drops = 0
+
+        if len(self._out) < frames:
+            self._out = np.zeros((frames, 1), dtype=np.int16)
+        out = self._out[:frames]
+
+        filled = min(len(self._leftover), frames)
+        out[:filled, 0] = self._leftover[:filled]
+        self._leftover = self._leftover[filled:]
+
+        while filled < frames:
+            stage.stats.max_depth = max(stage.stats.max_depth, self.queue.qsize())
+            frame = self._next_frame()
+            take = min(self.frame_length, frames - filled)
+            out[filled:filled + take, 0] = frame[:take]
+            filled += take
+            if take < self.frame_length:
+                self._leftover = frame[take:].copy()
+
+        with self._drops_lock:
+            dropped, self._pending_drops = self._pending_drops, 0
+        return out, dropped
+
+    def release(self):
+        """No stage is reading any more (e.g. HAL is busy answering)."""
+        if self._active is not None:
+            self._active.idle()
+        self._active = None
+
+    def report(self, readers):
+        """Return one line per stage: load (processing time / audio time), queue high-water mark and drops, then reset."""
+        sample_sec = 1.0 / self.samplerate
+        lines = []
+        for r in readers:
+            s = r.stats
+            if not s.samples:
+                continue
+            load = s.busy_time / (s.samples * sample_sec)
+            lines.append(
+                f"{s.name}: {s.samples * sample_sec:.1f}s audio, load {load*100:.0f}%, "
+                f"max gap {s.max_busy*1000:.0f}ms, max queue {s.max_depth}/{self.queue.maxsize}, drops {s.drops}"
+            )
+            s.reset()
+        lines.append(f"capture: {self.produced} frames, source overflows {self.source_overflows}, idle discards {self.idle_discards}")
+        return lines
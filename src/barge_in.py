@@ -0,0 +1,176 @@
+import threading
+import logging
+from math import gcd
+import numpy as np
+from scipy.signal import resample_poly
+from audio_buffers import AudioRing
+
+logger = logging.getLogger('HAL')
+
+
+class BargeInMonitor:
+    """
+    Keeps the wake word (and the push-to-talk key) armed while HAL is answering.
+    A background thread reads the capture pipeline, removes the part of the
+    microphone signal that is HAL's own playback (a per-frame least-squares echo
+    estimate against the playback reference), and runs Porcupine on the rest.
+    On a wake word or spacebar press `cancel` is set, so synthesis and playback
+    can stop immediately, and `trigger` / `buffered_audio` describe the new command.
+    """
+
+    def __init__(self, porcupine, stream, key_events, fs=16000, echo_delay=0.12,
+                 echo_search=0.04, prebuffer_duration=0.8, enabled=True):
+        self.porcupine = porcupine
+        self.stream = stream
+        self.key_events = key_events
+        self.fs = fs
+        self.frame_length = porcupine.frame_length
+        self.echo_delay = int(echo_delay * fs)  # output + input latency between playing and hearing a sample
+        self.echo_search = int(echo_search * fs)  # +/- range searched around echo_delay
+        self.enabled = enabled
+        self.prebuffer = AudioRing(int(prebuffer_duration * fs), dtype=np.int16)
+
+        self.cancel = threading.Event()
+        self.trigger = None
+        self.buffered_audio = None
+
+        self._ref = np.zeros(0, dtype=np.float32)
+        self._ref_start = 0  # monitor sample count at which the reference starts playing
+        self._consumed = 0  # samples read by the monitor since start()
+        self._mic = np.zeros(self.frame_length, dtype=np.float32)
+        self._residual = np.zeros(self.frame_length, dtype=np.int16)
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ---------------- control ----------------
+    def start(self):
+        if not self.enabled or self._thread is not None:
+            return
+        self.cancel.clear()
+        self.trigger = None
+        self.buffered_audio = None
+        self._ref = self._ref[:0]
+        self._consumed = 0
+        self.prebuffer.clear()
+        self._stop.clear()
+        self.stream.skip_to_latest()
+        self.key_events.pressed.clear()
+        self.key_events.subscribe(self._on_key)
+        self._thread = threading.Thread(target=self._run, name="barge-in", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop listening. Safe to call when not started; trigger info stays available."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.key_events.unsubscribe(self._on_key)
+        self.stream.idle()
+        self.stream.pipeline.release()
+
+    @property
+    def triggered(self):
+        return self.cancel.is_set()
+
+    def set_reference(self, audio, sr):
+        """
+        Register audio that is about to be played (any rate, mono or multi-channel float),
+        so it can be subtracted from what the microphone hears.
+        """
+        if not self.enabled:
+            return
+        self._ref = self._to_reference(audio, sr)
+        self._ref_start = self._now()
+
+    def extend_reference(self, audio, sr):
+        """
+        Register audio that will play right after what is already playing (the next sentence
+        on a shared output stream). If the previous audio has already ended, the gap is
+        filled with silence so the reference stays aligned with the speaker.
+        """
+        if not self.enabled:
+            return
+        if len(self._ref) == 0:
+            self.set_reference(audio, sr)
+            return
+        gap = self._now() - (self._ref_start + len(self._ref))
+        parts = [self._ref]
+        if gap > 0:
+            parts.append(np.zeros(gap, dtype=np.float32))
+        parts.append(self._to_reference(audio, sr))
+        self._ref = np.concatenate(parts)
+
+    def _to_reference(self, audio, sr):
+        mono = audio[:, 0] if audio.ndim > 1 else audio
+        if sr != self.fs:
+            g = gcd(int(sr), int(self.fs))
+            mono = resample_poly(mono, self.fs // g, int(sr) // g)
+        return np.ascontiguousarray(mono, dtype=np.float32)
+
+    def _now(self):
+        # monitor sample count the next played sample lines up with; frames still queued were captured earlier
+        queued = self.stream.pipeline.queue.qsize() * self.stream.pipeline.frame_length
+        return self._consumed + queued
+
+    # ---------------- monitor thread ----------------
+    def _on_key(self, event, timestamp):
+        if event == "press" and not self.cancel.is_set():
+            self.trigger = "spacebar"
+            self.cancel.set()
+
+    def _run(self):
+        try:
+            while not self._stop.is_set() and not self.cancel.is_set():
+                frame, _ = self.stream.read(self.frame_length)
+                pcm = frame[:, 0]
+
+                offset = self._consumed - self._ref_start - self.echo_delay
+                self._consumed += self.frame_length
+                residual = self._suppress_echo(pcm, offset)
+                # the prebuffer becomes the start of the next command: keep HAL's own voice out of it too
+                self.prebuffer.write(residual)
+
+                if self.porcupine.process(residual) >= 0 and not self.cancel.is_set():
+                    self.trigger = "wakeword"
+                    self.buffered_audio = self.prebuffer.latest(self.prebuffer.capacity)
+                    self.cancel.set()
+        except Exception as e:
+            logger.error(f"Barge-in monitor stopped: {e}")
+
+    def _suppress_echo(self, pcm, offset):
+        """
+        Subtract the best-matching scaled slice of the playback reference from the mic frame.
+        offset: reference sample expected to line up with the first sample of this frame.
+        """
+        n = self.frame_length
+        ref = self._ref
+        if len(ref) == 0 or offset + n + self.echo_search <= 0 or offset - self.echo_search >= len(ref):
+            return pcm  # nothing playing during this frame
+
+        mic = self._mic
+        mic[:] = pcm
+
+        # correlate the mic frame against every candidate alignment of the reference in one pass
+        lo = max(0, offset - self.echo_search)
+        hi = min(len(ref), offset + self.echo_search + n)
+        if hi - lo < n:
+            return pcm
+        window = ref[lo:hi]
+        correlation = np.correlate(window, mic, mode="valid")
+        squares = np.concatenate(([0.0], np.cumsum(window.astype(np.float64) ** 2)))
+        power = squares[n:] - squares[:-n]
+
+        # least-squares gain per alignment; the best one removes the most energy (corr^2 / power)
+        valid = (power > 1e-9) & (correlation > 0)
+        if not valid.any():
+            return pcm
+        removed = np.where(valid, correlation ** 2 / np.where(valid, power, 1.0), 0.0)
+        best = int(np.argmax(removed))
+        start, gain = lo + best, correlation[best] / power[best]
+
+        np.subtract(mic, gain * ref[start:start + n], out=mic)
+        np.clip(mic, -32768, 32767, out=mic)
+        self._residual[:] = mic
+        return self._residual
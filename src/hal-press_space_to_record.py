@@ -200,14 +200,15 @@ openai_api_key = os.getenv("OPENAI_API_KEY")
 llm = LLMClient(
     backend="openai",
     model_name="gpt-4.1-nano",
-    max_history=10,
-    openai_api_key=openai_api_key
+    history_tokens=3000,
+    openai_api_key=openai_api_key,
+    tool_mode="text"  # this script parses [EXTERNAL_API_CALL] replies itself
 )
 
 # llm = LLMClient(
 #     backend="ollama",
 #     model_name="llama3",  # or whichever Ollama model you want to use
-#     max_history=10
+#     history_tokens=3000
 # )
 
 # ------------------ Main loop ------------------ #
@@ -1,7 +1,12 @@
+import sys
+# `python hal.py --profile-startup`: time every import from here on plus every model/backend load, report and exit
+PROFILE_STARTUP = "--profile-startup" in sys.argv
+if PROFILE_STARTUP:
+    from startup_profile import profiler
+    profiler.install()
 import wave
 import platform
 import os
-import sys
 import subprocess
 import time
 import numpy as np
@@ -9,32 +14,33 @@ from scipy.signal import resample_poly
 import sounddevice as sd
 import soundfile as sf
 from dotenv import load_dotenv
-from piper import PiperVoice, SynthesisConfig
+from piper import SynthesisConfig
 from pydub import AudioSegment
 from pydub.effects import normalize, compress_dynamic_range
 import io
 from llm_client import LLMClient
-from whisper_stt import WhisperSTT
+from tools import ToolCall, API_CALL_PREFIX, next_call_instruction
+from audio_capture import AudioCapture, FileAudioSource
+from resampler import ResampledReader
+from audio_pipeline import AudioPipeline, CaptureStopped
+from audio_devices import AudioDeviceRegistry
+from listening import (RATE, PREBUFFER_DURATION, create_porcupine, wait_for_trigger, record_until_silence,
+                       record_while_spacebar_held, command_speech_end)
 from weather_api import fetch_current_weather, fetch_weather_forecast
 from wolfram_api import fetch_wolfram_answer
 from news_api import fetch_top_headlines, fetch_articles_by_keyword
-from calendar_api import ICloudCalendar
-calendar_backend = ICloudCalendar()
-from sports_api import SportsRouter
-sports_backend = SportsRouter()
-import pvporcupine
 import logging
-from collections import deque
-from pynput import keyboard
+from input_events import KeyEventService
+from barge_in import BargeInMonitor
+from startup import StartupOrchestrator, lazy, resolve
+from model_client import connect_model_server, RemoteSTT, RemoteVoice, RemoteNLP
+from sentence_segmenter import SentenceSegmenter
 import threading
 import queue
 import platform
 from led_manager import get_led
 import json
 import re
-import shlex
-import spacy
-nlp = spacy.load("en_core_web_sm")
 
 
 SYSTEM = platform.system()
@@ -85,63 +91,155 @@ PLATFORM = os.getenv("PLATFORM")
 # ------------------------------------------------------------
 # Recording/Playback Configuration
 # ------------------------------------------------------------
-RATE = 16000 # must be 16000 for porcupine
-CHUNK_SIZE = 1024
-PREBUFFER_DURATION = 0.8  # seconds of audio to keep before trigger
-SILENCE_DURATION = 0.8 # seconds of silence to wait before stopping recording
-SILENCE_THRESHOLD = float(os.getenv("SILENCE_THRESHOLD")) # loudness below which to start silence counter (e.g. 0.001)
+# (wake word, endpointing and recording limits are configured in listening.py)
+STT_STREAMING = os.getenv("STT_STREAMING", "True") == "True" # transcribe wake word commands incrementally while the user is speaking
+BARGE_IN = os.getenv("BARGE_IN", "True") == "True" # keep the wake word / spacebar armed while HAL is answering
+ECHO_DELAY = float(os.getenv("ECHO_DELAY", 0.12)) # seconds between playing a sample and hearing it in the mic (for echo suppression)
 COMPRESSION_THRESHOLD = float(os.getenv("COMPRESSION_THRESHOLD",0)) # amount to compress audio before playing back
 HI_PASS_FREQ = int(os.getenv("HI_PASS_FREQ",0))
+CAPTURE_BUFFER_SECONDS = float(os.getenv("CAPTURE_BUFFER_SECONDS", 5.0)) # size of the shared capture ring buffer
+PIPELINE_QUEUE_SECONDS = float(os.getenv("PIPELINE_QUEUE_SECONDS", 2.0)) # how far a slow consumer may fall behind before frames are dropped
+PIPELINE_FRAME_LENGTH = 512 # samples per frame pushed by the capture thread (= porcupine.frame_length)
+DEVICE_RETRY_SECONDS = 3.0 # wait before trying again when no input device can be opened
+AUDIO_SOURCE_FILE = os.getenv("AUDIO_SOURCE_FILE") # replay a WAV/FLAC file instead of listening to the microphone
+AUDIO_SOURCE_REALTIME = os.getenv("AUDIO_SOURCE_REALTIME", "True") == "True" # pace the replayed file like a live stream
+LLM_STREAMING = os.getenv("LLM_STREAMING", "True") == "True" # speak HAL's answer sentence by sentence while it is still being generated
 # if PLATFORM == "pi":
 #     sd.default.device = "pulse"
 
 # ------------------------------------------------------------
 # Shared State for recording
 # ------------------------------------------------------------
-audio_queue = queue.Queue()
-trigger_event = threading.Event()
-trigger_type = {"value": None}
-prebuffer = queue.deque(maxlen=int(PREBUFFER_DURATION * RATE / CHUNK_SIZE)) # ring buffer for prebuffering wake-word audio
+audio_queue = queue.Queue(maxsize=max(1, int(PIPELINE_QUEUE_SECONDS * RATE / PIPELINE_FRAME_LENGTH))) # bounded frame queue between the capture thread and the consumers
 
 # ------------------------------------------------------------
-# Porcupine Wake Word Configuration
+# Model server – if one is running (python model_server.py), use its resident
+# Whisper, Piper and spaCy models instead of loading our own
 # ------------------------------------------------------------
-ACCESS_KEY = os.getenv("PICOVOICE_ACCESS_KEY")
-KEYWORDS = ["computer"]
-KEYWORD_PATHS = os.getenv("KEYWORD_FILE_PATH")
-porcupine = pvporcupine.create(access_key=ACCESS_KEY, keyword_paths=[KEYWORD_PATHS])
+USE_MODEL_SERVER = os.getenv("USE_MODEL_SERVER", "True") == "True"
+model_server, model_server_info = connect_model_server() if USE_MODEL_SERVER else (None, None)
+if model_server is not None:
+    logger.info(f"Using resident models from the model server at {model_server.path} ({model_server_info['models']})")
 
 # ------------------------------------------------------------
 # Load HAL voice 
 # ------------------------------------------------------------
-voice = PiperVoice.load("piper-models/hal.onnx")
+VOICE_MODEL_PATH = "piper-models/hal.onnx"
 syn_config = SynthesisConfig(volume=1.0, length_scale=1.0, noise_scale=1.0, noise_w_scale=1.0, normalize_audio=False)
 
+def load_voice():
+    if model_server is not None:
+        return RemoteVoice(model_server, model_server_info, fallback=load_local_voice)
+    return load_local_voice()
+
+def load_local_voice():
+    from model_cache import load_piper
+    return load_piper(VOICE_MODEL_PATH)
+
+def voice_sample_rate(model_path=VOICE_MODEL_PATH):
+    """The voice's output rate, read from its config so nothing has to wait for the model itself."""
+    with open(f"{model_path}.json", "r", encoding="utf-8") as f:
+        return json.load(f)["audio"]["sample_rate"]
+
+# ------------------------------------------------------------
+# Audio devices – picked and probed once (capture at 16kHz, playback at the voice's rate if supported)
+# ------------------------------------------------------------
+def create_device_registry():
+    registry = AudioDeviceRegistry(capture_rate=RATE, playback_rate=voice_sample_rate())
+    logger.info(f"Audio devices: {registry.describe()}")
+    return registry
+
 # ------------------------------------------------------------
 # Load Whisper – speech to text model
 # ------------------------------------------------------------
-stt = WhisperSTT()
+TRANSCRIPTION_BACKEND = os.getenv("TRANSCRIPTION_BACKEND", "local").lower() # "local", "local_int8" (quantized, CPU) or "api"
+
+def create_stt():
+    # if the model server goes away mid-session, the remote client loads the local model instead
+    if model_server is not None:
+        return RemoteSTT(model_server, fallback=create_local_stt)
+    return create_local_stt()
+
+def create_local_stt():
+    from whisper_stt import WhisperSTT, QuantizedWhisperSTT
+    if TRANSCRIPTION_BACKEND == "local_int8":
+        return QuantizedWhisperSTT()
+    return WhisperSTT()
 
 # ------------------------------------------------------------
 # LLM Configuration
 # ------------------------------------------------------------
 LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
-if LLM_BACKEND == "openai":
-    llm = LLMClient(
-        backend="openai",
-        model_name=os.getenv("LLM_MODEL"),
-        max_history=int(os.getenv("LLM_MAX_HISTORY")),
-        openai_api_key=os.getenv("OPENAI_API_KEY")
-    )
-elif LLM_BACKEND == "ollama":
-    llm = LLMClient(
-        backend="ollama",
-        model_name=os.getenv("LLM_MODEL"),
-        max_history=int(os.getenv("LLM_MAX_HISTORY"))
-    )
-else:
-    llm = None
-    raise ValueError(f"Unknown LLM Backend: {LLM_BACKEND}")
+LLM_HISTORY_TOKENS = int(os.getenv("LLM_HISTORY_TOKENS", 3000)) # token budget for the conversation history; older turns are summarized
+LLM_TOOL_MODE = os.getenv("LLM_TOOL_MODE") # "native" tool calling or the "text" [EXTERNAL_API_CALL] protocol (default: native for openai, text for ollama)
+
+def create_llm():
+    if LLM_BACKEND == "openai":
+        return LLMClient(
+            backend="openai",
+            model_name=os.getenv("LLM_MODEL"),
+            history_tokens=LLM_HISTORY_TOKENS,
+            openai_api_key=os.getenv("OPENAI_API_KEY"),
+            tool_mode=LLM_TOOL_MODE
+        )
+    elif LLM_BACKEND == "ollama":
+        client = LLMClient(
+            backend="ollama",
+            model_name=os.getenv("LLM_MODEL"),
+            history_tokens=LLM_HISTORY_TOKENS,
+            tool_mode=LLM_TOOL_MODE
+        )
+        client.warm_up()  # load the model while the rest of HAL starts up
+        return client
+    else:
+        raise ValueError(f"Unknown LLM Backend: {LLM_BACKEND}")
+
+# ------------------------------------------------------------
+# Rarely used backends – created the first time HAL needs them
+# ------------------------------------------------------------
+def create_calendar():
+    from calendar_api import ICloudCalendar
+    return ICloudCalendar()  # may ask for a 2FA code on first use
+
+def create_sports():
+    from sports_api import SportsRouter
+    return SportsRouter()
+
+def load_nlp():
+    if model_server is not None:
+        return RemoteNLP(model_server, fallback=load_local_nlp)
+    return load_local_nlp()
+
+def load_local_nlp():
+    from model_cache import load_ner
+    return load_ner()
+
+# ------------------------------------------------------------
+# Startup – independent models load in parallel; each global below waits for
+# its stage on first use, so the wake word can start listening as soon as
+# Porcupine and the input device are ready while Whisper etc. are still loading
+# ------------------------------------------------------------
+startup = StartupOrchestrator()
+startup.add("porcupine", create_porcupine)
+startup.add("devices", create_device_registry)
+startup.add("voice", load_voice)
+startup.add("stt", create_stt)
+startup.add("llm", create_llm)
+startup.start()
+
+porcupine = startup.proxy("porcupine")
+device_registry = startup.proxy("devices")
+voice = startup.proxy("voice")
+stt = startup.proxy("stt")
+llm = startup.proxy("llm")
+calendar_backend = lazy(create_calendar, "calendar")
+sports_backend = lazy(create_sports, "sports")
+nlp = lazy(load_nlp, "spaCy")
+
+# ------------------------------------------------------------
+# Keyboard – one listener for the whole session publishes spacebar press/release
+# ------------------------------------------------------------
+key_events = KeyEventService()
 
 # ------------------------------------------------------------
 # Get LED if on raspberry pi, dummy if not
@@ -152,12 +250,47 @@ led = get_led()
 # Main Loop
 # ------------------------------------------------------------
 def run():
+    # only the wake word path has to be ready to start listening; everything else is gated on first use
+    startup.result("porcupine")
+    startup.result("devices")
     logger.info("========================= HAL 9000 is now online.\n")
 
+    # open the input device once; it keeps capturing into a ring buffer for the whole session
+    capture, pipeline, stage_streams = start_capture()
+    key_events.start()
+    barge_in = start_barge_in_monitor(stage_streams)
+    pending_trigger = None # set when the user interrupts HAL, so the next command starts right away
+    device_lost = False # set when capture failed, e.g. the microphone was unplugged
+    device_changed = None if AUDIO_SOURCE_FILE else device_registry.changed
+
     while True:
         try:
-            # wait for trigger – either wake word or spacebar press
-            trigger, stream, prebuffered_audio = wait_for_trigger()
+            # a sound card was plugged in or removed: re-scan devices and reopen capture
+            if device_lost or (device_changed is not None and device_changed()):
+                logger.info("Audio device change detected – re-scanning devices")
+                pipeline.stop()
+                capture.close()
+                pipeline.join()
+                try:
+                    device_registry.refresh(reinitialize=True)
+                    capture, pipeline, stage_streams = start_capture()
+                except Exception as e:
+                    logger.error(f"No usable audio input ({e}) – retrying in {DEVICE_RETRY_SECONDS:.0f}s")
+                    device_lost = True
+                    time.sleep(DEVICE_RETRY_SECONDS)
+                    continue
+                device_lost = False
+                logger.info(f"Audio devices: {device_registry.describe()}")
+                barge_in = start_barge_in_monitor(stage_streams)
+
+            # wait for trigger – either wake word or spacebar press (unless HAL was just interrupted by one)
+            if pending_trigger is not None:
+                trigger, prebuffered_audio = pending_trigger
+                pending_trigger = None
+            else:
+                trigger, prebuffered_audio = wait_for_trigger(stage_streams["wakeword"], porcupine, key_events, device_changed=device_changed)
+                if trigger == "device_change":
+                    continue
             logger.info("====================================================================")
 
             # if on raspberry pi, light LED
@@ -165,25 +298,34 @@ def run():
             led.on()
 
             # if spacebar, record until spacebar is released
+            transcription = None
             if trigger == "spacebar":
                 logger.info("Push-to-talk (Spacebar hold) triggered.")
-                audio, fs = record_while_spacebar_held(stream)
-            # if wake word, record until silence threshold is met
+                audio, fs = record_while_spacebar_held(stage_streams["push_to_talk"], key_events)
+            # if wake word, record until the end of speech is detected,
+            # transcribing finished phrases in the background while the user keeps talking
             elif trigger == "wakeword":
                 logger.info("Wake word triggered.")
-                audio, fs = record_until_silence(stream, initial_audio=prebuffered_audio)
-            # if neither, close stream and restart loop
+                transcription = stt.start_stream(RATE) if STT_STREAMING else None
+                audio, fs = record_until_silence(stage_streams["vad_record"], initial_audio=prebuffered_audio, transcription=transcription)
+            # if neither, restart loop
             else:
-                stream.stop()
-                stream.close()
                 continue
 
-            # close stream after recording is finished
-            stream.stop()
-            stream.close()
+            # nobody consumes audio until the next wait_for_trigger; report how the stages kept up
+            pipeline.release()
+            for line in pipeline.report(stage_streams.values()):
+                logger.info(f"Pipeline {line}")
+
+            # finish the incremental transcript before the buffer is modified below
+            user_input = None
+            if transcription is not None:
+                user_input = transcription.finalize(audio, speech_end=command_speech_end(prebuffered_audio))
+                logger.info(f"Incremental transcription: {len(transcription.segment_times)} background segment(s), "
+                            f"{transcription.final_time or 0:.2f} sec after endpoint")
 
-            # normalize recorded audio
-            audio = normalize_audio(audio)
+            # normalize recorded audio (in place – audio is a view of the shared command buffer)
+            audio = normalize_audio(audio, in_place=True)
 
             # save and play back command audio for debugging purposes
             # if DEBUG_ON is set in .env
@@ -193,59 +335,73 @@ def run():
                 play_audio("last_command.wav")
 
             # transcribe audio to text
-            user_input = stt.transcribe(audio, fs)
+            if user_input is None:
+                user_input = stt.transcribe(audio, fs)
             logger.info(f"USER: {user_input}")
 
-            # get HAL's response from LLM
-            hal_reply = llm.get_response(user_input)
+            # from here on a wake word or spacebar press interrupts HAL's answer
+            barge_in.start()
+
+            # get HAL's response from LLM (already spoken if it was streamed)
+            hal_reply, spoken = get_reply(user_input, barge_in)
 
             # If HAL claims not to know, force it to try Wikipedia before giving up
             # first testing if the query looks like a factual question about a named entity we can search for
-            if re.search(r"(i\s+don.?t\s+know|i\s+don.?t\s+have|i.?m\s+sorry.*can.?t\s+do)", hal_reply.strip(), re.I):
-                named_entities = extract_named_entities(user_input)
+            if not spoken and not llm.pending_tool_calls and IGNORANCE_PATTERN.search(hal_reply.strip()):
+                # the cheap question check first: spaCy only runs if it could matter
+                named_entities = extract_named_entities(user_input) if looks_factual(user_input) else []
                 if DEBUG_ON:
                     logger.debug(f"HAL responded with ignorance: {hal_reply}")
                     logger.debug(f"Searching for named entities in query...")
                     logger.debug(f"Named entities: {named_entities}")
-                if looks_factual(user_input) and named_entities:
+                if named_entities:
                     logger.warning("HAL ignorance detected on factual question – forcing Wikipedia search")
-                    hal_reply = f"[EXTERNAL_API_CALL] wikipedia search {named_entities[0]}"
+                    llm.force_tool_call(ToolCall("wikipedia_search", {"query": named_entities[0]}))
                 else:
                     logger.debug("Either no named entities found or question was not parsed as factual. NOT forcing wikipedia search")
 
-            # keep handling API calls until HAL gives a final answer
-            while hal_reply.startswith("[EXTERNAL_API_CALL]"):
+            # keep handling API calls until HAL gives a final answer (a turn may ask for several at once)
+            while llm.pending_tool_calls and not barge_in.triggered:
                 logger.debug("HAL: Just a moment...")
-                play_audio("HAL-clips/just_a_moment_normalized.aiff")
-
-                logger.info(f"HAL (external request): {hal_reply}")
-                command = shlex.split(hal_reply[len("[EXTERNAL_API_CALL]"):].strip()) # shlex splits by space, except respect quotes
-                api_type = command[0].lower()
-                params = command[1:]
-
-                api_response = handle_api_call(api_type, params, user_input)
-                enriched_prompt = f"[EXTERNAL_API_RESPONSE] {api_response}"
-                if DEBUG_ON:
-                    logger.info(f"Enriched prompt for HAL: {enriched_prompt}") # full response (may be very long)
-                else:
-                    logger.info(f"Enriched prompt for HAL: {(enriched_prompt[:800] + "[…]\n[TRUNCATED (for logging only)]") if len(enriched_prompt) > 800 else enriched_prompt}") # truncated response
-
-                hal_reply = llm.get_response(enriched_prompt)
+                play_audio("HAL-clips/just_a_moment_normalized.aiff", monitor=barge_in)
+
+                results = []
+                for call in llm.pending_tool_calls:
+                    logger.info(f"HAL (external request): {call}")
+                    if call.error:
+                        api_response = call.error
+                    else:
+                        api_type, params = call.command
+                        api_response = handle_api_call(api_type, params, user_input, tool_mode=llm.tool_mode)
+                    if DEBUG_ON:
+                        logger.info(f"API response for HAL: {api_response}") # full response (may be very long)
+                    else:
+                        logger.info(f"API response for HAL: {(api_response[:800] + "[…]\n[TRUNCATED (for logging only)]") if len(api_response) > 800 else api_response}") # truncated response
+                    results.append((call, api_response))
+                llm.add_tool_results(results)
+
+                hal_reply, spoken = get_reply(None, barge_in)
 
 
             logger.info(f"HAL: {hal_reply}")
 
-            # create audio from response text and save to file
-            with wave.open("hal_output.wav", "wb") as wav_file:
-                voice.synthesize_wav(hal_reply, wav_file, syn_config=syn_config)
-
-            # normalize audio file
-            audio, fs = sf.read("hal_output.wav", dtype="float32")
-            normalized_audio = normalize_audio(audio)
-            sf.write("hal_output.wav", normalized_audio, fs)
-
-            # play audio of HAL's response from normalized file
-            play_audio("hal_output.wav")
+            # create audio from response text and save to file (stops early on barge-in)
+            if not spoken and hal_reply and not barge_in.triggered and synthesize_to_file(hal_reply, "hal_output.wav", cancel=barge_in.cancel):
+                # normalize audio file
+                audio, fs = sf.read("hal_output.wav", dtype="float32")
+                normalized_audio = normalize_audio(audio)
+                sf.write("hal_output.wav", normalized_audio, fs)
+
+                # play audio of HAL's response from normalized file
+                play_audio("hal_output.wav", monitor=barge_in)
+
+            # if the user interrupted, go straight to recording their next command
+            barge_in.stop()
+            if barge_in.triggered:
+                logger.info(f"Barge-in ({barge_in.trigger}) – response cancelled")
+                llm.cancel_tool_calls()  # close out tool calls HAL didn't get to
+                pending_trigger = (barge_in.trigger, barge_in.buffered_audio)
+                continue
 
             #turn LED off
             logger.info("Turning LED off")
@@ -254,19 +410,36 @@ def run():
         except KeyboardInterrupt:
             logger.info("Keyboard interrupt received. Shutting down gracefully.")
             led.off()
+            barge_in.stop()
+            key_events.stop()
+            pipeline.stop()
+            capture.close()
             porcupine.delete()
             sys.exit(0)
 
+        except CaptureStopped as e:
+            led.off()
+            barge_in.stop()
+            if AUDIO_SOURCE_FILE:
+                raise  # the replayed file has ended
+            # the input device went away mid-session: refresh devices instead of exiting
+            logger.warning(f"{e} – reopening audio input")
+            device_lost = True
+
         except Exception:
             led.off()
+            barge_in.stop()
+            pipeline.stop()
+            capture.close()
             raise
 
 # ------------------------------------------------------------
 # API CALL
 # ------------------------------------------------------------
-def handle_api_call(api_type, params, user_input):
+def handle_api_call(api_type, params, user_input, tool_mode="text"):
     """
     Executes an external API call based on type and params.
+    tool_mode is how the LLM makes calls ("native" or "text"), so follow-up instructions match it.
     Returns a string `api_response` that will be fed back to HAL.
     """
     try:
@@ -306,7 +479,7 @@ def handle_api_call(api_type, params, user_input):
                         f"{json.dumps(results)}\n\n"
                         "DO NOT attempt to answer the user's question based on the above information. "
                         "DO NOT give up on answering the question. Pick the most relevant article from the JSON search results, "
-                        "and respond with another API call as instructed, in order to receive either a summary of the article or "
+                        f"and {next_call_instruction('wikipedia_fetch', tool_mode)}, in order to receive either a summary of the article or "
                         "the full text of the article. ONLY THEN may you respond to the user."
                     )
                 else:
@@ -375,10 +548,34 @@ def looks_factual(query: str) -> bool:
     query = query.lower()
     return any(re.search(p, query) for p in FACTUAL_TRIGGERS)
 
+# words that are capitalized only because they start a sentence
+SENTENCE_STARTERS = {
+    "who", "what", "when", "where", "which", "why", "how", "is", "are", "was", "were", "do", "does", "did",
+    "can", "could", "would", "will", "should", "tell", "give", "show", "the", "a", "an", "in", "on", "at",
+    "and", "but", "so", "please", "hey", "hal", "okay", "ok", "well", "my", "i", "i'm", "i've", "you",
+}
+
+def has_entity_candidate(text: str) -> bool:
+    """
+    Cheap pre-check for extract_named_entities(): True if the text has a capitalized word
+    (or a number) that isn't just the first word of a sentence. No candidate, no entity.
+    """
+    for sentence in re.split(r"(?<=[.!?])\s+", text.strip()):
+        for i, word in enumerate(sentence.split()):
+            word = word.strip("\"'“”‘’()[],.!?:;")
+            if not word or not (word[0].isupper() or word[0].isdigit()):
+                continue
+            if word.lower() in SENTENCE_STARTERS and (i == 0 or word in ("I", "I'm", "I've")):
+                continue
+            return True
+    return False
+
 def extract_named_entities(user_input: str):
     """
     Check if the input contains relevant named entities and return them.
     """
+    if not has_entity_candidate(user_input):
+        return []
     doc = nlp(user_input)
     entities = []
     allowed_types = ["PERSON", "ORG", "WORK_OF_ART", "EVENT", "GPE", "LOC"]
@@ -464,9 +661,43 @@ def extract_named_entities(user_input: str):
 #     except Exception as e:
 #         logger.error(f"Audio playback failed: {e}")
 
-def play_audio(filename):
-    # Load audio, apply high pass filter
-    audio = AudioSegment.from_file(filename)
+def play_audio(filename, monitor=None):
+    """
+    Plays an audio file on the output device.
+    monitor: optional BargeInMonitor – playback is registered as its echo reference
+    and stops as soon as it reports a barge-in. Returns True if playback was interrupted.
+    """
+    return play_segment(AudioSegment.from_file(filename), monitor=monitor)
+
+def play_segment(audio, monitor=None):
+    """Plays a pydub AudioSegment; same behaviour as play_audio()."""
+    data, sr = prepare_segment(audio)
+
+    # normalize audio
+    peak = np.max(np.abs(data))
+    if peak > 0:
+        data = data / peak  # scale so max amplitude is 1.0
+
+    # Play and wait
+    output_device, _ = get_default_device("output")
+    if monitor is not None:
+        monitor.set_reference(data, sr)
+    sd.play(data, samplerate=sr, device=output_device)
+    if monitor is None:
+        sd.wait()
+        return False
+
+    # poll for barge-in while playing
+    while sd.get_stream().active:
+        if monitor.cancel.wait(timeout=0.02):
+            sd.stop()
+            logger.info("Playback interrupted")
+            return True
+    return False
+
+def prepare_segment(audio):
+    """High-pass filters a pydub AudioSegment and returns it as (float32 stereo array, rate) at the output device's rate."""
+    # apply high pass filter
     audio = audio.high_pass_filter(HI_PASS_FREQ)
 
     # Export to raw data for playback
@@ -485,7 +716,7 @@ def play_audio(filename):
         data = np.tile(data, (1, 2))
 
     # ALSA USB output
-    output_device, device_sr = get_default_device("output")
+    _, device_sr = get_default_device("output")
     # output_device = "hw:3,0"
 
     # Resample if needed
@@ -495,23 +726,189 @@ def play_audio(filename):
         down = sr // gcd
         data = resample_poly(data, up, down, axis=0)
         sr = device_sr
+    return data, sr
 
-    # normalize audio
-    peak = np.max(np.abs(data))
-    if peak > 0:
-        data = data / peak  # scale so max amplitude is 1.0
+class ReplyPlayer:
+    """
+    Plays the sentences of one reply back to back through a single output stream, so there is
+    no device-open gap between them, at one gain for the whole reply: set by the first sentence's
+    peak (as play_segment normalizes) and only ever lowered if a later sentence would clip.
+    """
 
-    # Play and wait
-    sd.play(data, samplerate=sr, device=output_device)
-    sd.wait()
+    BLOCK_SECONDS = 0.05 # written per call, so a barge-in stops playback within about this long
+
+    def __init__(self, monitor=None):
+        self.monitor = monitor
+        self.gain = None
+        self.stream = None
+        self.interrupted = False
+
+    def play(self, segment):
+        """Queues a sentence (pydub AudioSegment) and returns once it has been handed to the device; True if interrupted."""
+        if self.interrupted:
+            return True
+        data, sr = prepare_segment(segment)
+        peak = np.max(np.abs(data))
+        if peak > 0:
+            self.gain = 1.0 / peak if self.gain is None else min(self.gain, 1.0 / peak)
+            data = (data * self.gain).astype(np.float32)
+
+        if self.stream is None:
+            output_device, _ = get_default_device("output")
+            self.stream = sd.OutputStream(samplerate=sr, channels=data.shape[1], dtype="float32", device=output_device)
+            self.stream.start()
+        if self.monitor is not None:
+            self.monitor.extend_reference(data, sr)
+
+        block = max(1, int(self.BLOCK_SECONDS * sr))
+        for i in range(0, len(data), block):
+            if self.monitor is not None and self.monitor.cancel.is_set():
+                self.interrupted = True
+                logger.info("Playback interrupted")
+                return True
+            self.stream.write(np.ascontiguousarray(data[i:i + block]))
+        return False
+
+    def close(self):
+        """Lets queued audio finish playing (or drops it if interrupted) and closes the stream."""
+        if self.stream is None:
+            return
+        try:
+            if self.interrupted or (self.monitor is not None and self.monitor.cancel.is_set()):
+                self.stream.abort()
+            else:
+                self.stream.stop()  # waits for the buffered audio to play out
+        finally:
+            self.stream.close()
+            self.stream = None
+
+def synthesize_to_file(text, filename, cancel=None):
+    """
+    Synthesizes text with the HAL voice into a wav file, one sentence at a time.
+    Returns False (leaving a partial file) if `cancel` gets set before synthesis finishes.
+    """
+    with wave.open(filename, "wb") as wav_file:
+        wav_file.setframerate(voice.config.sample_rate)
+        wav_file.setsampwidth(2) # 16-bit
+        wav_file.setnchannels(1)
+        for chunk in voice.synthesize(text, syn_config=syn_config):
+            if cancel is not None and cancel.is_set():
+                logger.info("Synthesis interrupted")
+                return False
+            wav_file.writeframes(chunk.audio_int16_bytes)
+    return not (cancel is not None and cancel.is_set())
+
+def synthesize_segment(text):
+    """Synthesizes text with the HAL voice into an in-memory AudioSegment."""
+    pcm = b"".join(chunk.audio_int16_bytes for chunk in voice.synthesize(text, syn_config=syn_config))
+    return AudioSegment(data=pcm, sample_width=2, frame_rate=voice.config.sample_rate, channels=1)
+
+# ------------------------------------------------------------
+# LLM replies – streamed sentence by sentence into the voice
+# ------------------------------------------------------------
+IGNORANCE_PATTERN = re.compile(r"(i\s+don.?t\s+know|i\s+don.?t\s+have|i.?m\s+sorry.*can.?t\s+do)", re.I)
+IGNORANCE_WINDOW_SENTENCES = 2 # a streamed reply is checked for ignorance over its first sentences ("I'm sorry Torgo. I'm afraid I can't do that.")...
+IGNORANCE_WINDOW_CHARS = 60 # ...or this many characters, whichever comes first, before HAL starts speaking it
+
+def get_reply(prompt, monitor):
+    """
+    Asks the LLM for HAL's reply (prompt None continues after tool results). Returns
+    (reply, spoken): with LLM_STREAMING a normal answer has already been played by
+    the time this returns; API calls and "I don't know" answers are never spoken
+    here, so the caller can act on them.
+    """
+    if not LLM_STREAMING:
+        return llm.get_response(prompt), False
+    return speak_streamed(llm.stream_response(prompt), monitor)
 
-def normalize_audio(audio, peak=0.95):
+def speak_streamed(deltas, monitor=None):
+    """
+    Plays a streamed reply while it is generated: a worker thread cuts the text into sentences
+    and synthesizes each one as soon as it is complete, while this thread plays them in order.
+    The opening of the reply (the first two sentences, or 60 characters) decides whether it is
+    speakable at all (not an API call or an admission of ignorance); if not, the rest is read
+    silently and (reply, False) is returned.
+    """
+    start = time.time()
+    deltas = iter(deltas)
+    segmenter = SentenceSegmenter()
+    parts = []
+    sentences = []
+
+    # wait until the opening can be judged (or the reply has ended)
+    for delta in deltas:
+        parts.append(delta)
+        sentences.extend(segmenter.feed(delta))
+        if len(sentences) >= IGNORANCE_WINDOW_SENTENCES or len(" ".join(sentences)) >= IGNORANCE_WINDOW_CHARS:
+            break
+    else:
+        tail = segmenter.flush()
+        if tail:
+            sentences.append(tail)
+    head = "".join(parts).lstrip()
+    if not sentences or head.startswith(API_CALL_PREFIX) or IGNORANCE_PATTERN.search(" ".join(sentences)):
+        parts.extend(deltas)
+        return "".join(parts).strip(), False
+    logger.info(f"First sentence after {time.time() - start:.2f}s")
+
+    cancel = monitor.cancel if monitor is not None else threading.Event()
+    ready = queue.Queue(maxsize=3)  # synthesized sentences waiting to be played
+    errors = []
+
+    def produce():
+        try:
+            for sentence in sentences:
+                ready.put(synthesize_segment(sentence))
+            for delta in deltas:
+                if cancel.is_set():
+                    break
+                parts.append(delta)
+                for sentence in segmenter.feed(delta):
+                    ready.put(synthesize_segment(sentence))
+            tail = segmenter.flush()
+            if tail and not cancel.is_set():
+                ready.put(synthesize_segment(tail))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            close = getattr(deltas, "close", None)
+            if close is not None:
+                close()  # stop generating (and record the partial reply) if we were interrupted
+            ready.put(None)
+
+    producer = threading.Thread(target=produce, name="reply-synthesis", daemon=True)
+    producer.start()
+    player = ReplyPlayer(monitor)
+    first = True
+    try:
+        while True:
+            segment = ready.get()
+            if segment is None:
+                break
+            if cancel.is_set():
+                continue  # interrupted: keep draining so the producer can finish
+            if first:
+                logger.info(f"Time to first audio: {time.time() - start:.2f}s")
+                first = False
+            player.play(segment)
+    finally:
+        player.close()
+    producer.join()
+    if errors:
+        raise errors[0]
+    return "".join(parts).strip(), True
+
+def normalize_audio(audio, peak=0.95, in_place=False):
     """
     Normalize a float32 audio array to the given peak amplitude.
+    With in_place=True the array is scaled where it is instead of copied.
     """
-    max_val = np.max(np.abs(audio))
+    max_val = np.max(np.abs(audio)) if len(audio) else 0
     if max_val > 0:
-        audio = (audio / max_val) * peak
+        if in_place:
+            audio *= peak / max_val
+        else:
+            audio = (audio / max_val) * peak
     return audio
 
 def add_reverb(input_wav, output_wav, delay_ms=120, decay=0.4, tail_volume_db=30):
@@ -530,238 +927,75 @@ def get_default_device(kind="input"):
     """
     Returns a tuple (device, samplerate) suitable for sounddevice streams.
     kind: "input" or "output"
+    Served from the device registry, which only re-scans when a device change is detected.
     """
-    devices = sd.query_devices()
-
-    if kind == "input":
-        if SYSTEM == "Linux":
-            # pick USB mic if available
-            for i, dev in enumerate(devices):
-                if dev['max_input_channels'] > 0 and ("Microphone" in dev['name'] or "USB" in dev['name']):
-                    return i, int(dev['default_samplerate'])
-            # fallback: first input device
-            for i, dev in enumerate(devices):
-                if dev['max_input_channels'] > 0:
-                    return i, int(dev['default_samplerate'])
-        else:
-            # macOS/Windows: use default device
-            return None, RATE
-    else:  # output
-        if SYSTEM == "Linux":
-            # pick USB speaker if available
-            for i, dev in enumerate(devices):
-                if dev['max_output_channels'] > 0 and ("USB" in dev['name'] or "Device" in dev['name']):
-                    return i, int(dev['default_samplerate'])
-            # fallback: first output device
-            for i, dev in enumerate(devices):
-                if dev['max_output_channels'] > 0:
-                    return i, int(dev['default_samplerate'])
-        else:
-            # macOS/Windows: default output
-            return None, 44100
-
+    return device_registry.input() if kind == "input" else device_registry.output()
 
-
-# ------------------------------------------------------------
-# Record until silence (used with wake word detection)
-# ------------------------------------------------------------
-def record_until_silence(stream, initial_audio=None, silence_threshold=SILENCE_THRESHOLD,
-                         silence_duration=SILENCE_DURATION, fs=RATE, max_duration=12.0):
+def start_capture():
     """
-    Records audio until a period of silence is detected or max_duration is reached.
-    Handles arbitrary device sample rates correctly.
-    - initial_audio: numpy array of prebuffered audio (optional)
-    - silence_threshold: RMS below which is considered silence
-    - silence_duration: seconds of consecutive silence to stop recording
-    - fs: target sample rate (default 16000)
-    - max_duration: hard stop in seconds
+    Opens the long-lived capture stream on the registry's input device (or AUDIO_SOURCE_FILE, if set)
+    and starts the pipeline.
+    Returns (capture, pipeline, stage_streams) where stage_streams maps stage name -> reader.
     """
-    recording = []
-
-    # Include prebuffer if provided
-    if initial_audio is not None:
-        logger.debug(f"Initial prebuffer length: {len(initial_audio)} samples (~{len(initial_audio)/fs:.2f} sec)")
-        recording.append(initial_audio.astype("float32"))
-
-    # Determine device sample rate from stream
-    device_fs = int(stream.samplerate)
-    chunk_size = CHUNK_SIZE
-
-    # Compute how many consecutive chunks equal desired silence duration
-    chunk_duration_sec = chunk_size / fs
-    max_silence_chunks = int(silence_duration / chunk_duration_sec)
-
-    # Maximum chunks to prevent infinite recording
-    max_chunks = int(max_duration / chunk_duration_sec)
-    chunks_recorded = 0
-    silence_counter = 0
-
-    logger.info("Recording command (silence detection)...")
-    start_time = time.time()
-
-    while chunks_recorded < max_chunks:
-        # Read a chunk from stream
-        chunk, _ = stream.read(chunk_size)
-        chunk = chunk.flatten().astype(np.float32) / 32768.0
-
-        # Resample if device_fs != fs
-        if device_fs != fs:
-            chunk = np.interp(
-                np.linspace(0, len(chunk), int(len(chunk) * fs / device_fs)),
-                np.arange(len(chunk)),
-                chunk
-            ).astype(np.float32)
-
-        recording.append(chunk)
-        chunks_recorded += 1
-
-        rms = np.sqrt(np.mean(chunk**2))
-        if rms < silence_threshold:
-            silence_counter += 1
-        else:
-            silence_counter = 0
-
-        if DEBUG_ON:
-            logger.debug(f"Chunk {chunks_recorded}: RMS={rms:.6f}, silence_counter={silence_counter}")
-
-        if silence_counter >= max_silence_chunks:
-            if DEBUG_ON:
-               logger.debug(f"Silence threshold reached after {chunks_recorded} chunks.")
-            break
-
-    duration = time.time() - start_time
-    audio = np.concatenate(recording)
-    logger.info(f"Recording complete. Total duration: {len(audio)/fs:.2f} sec (loop time {duration:.2f} sec)")
-
-    return audio, fs
-
-
-# ------------------------------------------------------------
-# Record while spacebar is held 
-# ------------------------------------------------------------
-def record_while_spacebar_held(stream, fs=RATE):
-    """
-    Records audio while the spacebar is held down.
-    Stops immediately when the spacebar is released.
-    """
-    recording = []
-    stop_event = threading.Event()
-    device_fs = int(stream.samplerate)
-
-    def on_release(key):
-        if key == keyboard.Key.space:
-            stop_event.set()
-            return False
-
-    listener = keyboard.Listener(on_release=on_release)
-    listener.start()
-
-    logger.info("Recording command (push-to-talk, hold spacebar)...")
-    start_time = time.time()
-    while not stop_event.is_set():
-        chunk, _ = stream.read(CHUNK_SIZE)
-        chunk = chunk.flatten().astype(np.float32) / 32768.0
-
-        # Resample to 16kHz if needed
-        if device_fs != fs:
-            chunk = np.interp(
-                np.linspace(0, len(chunk), int(len(chunk) * fs / device_fs)),
-                np.arange(len(chunk)),
-                chunk
-            ).astype(np.float32)
-
-        recording.append(chunk)
-
-    listener.join()
-
-    duration = time.time() - start_time
-    audio = np.concatenate(recording) if recording else np.array([], dtype=np.float32)
-    logger.info(f"Recording complete (spacebar released). Total duration: {len(audio)/fs:.2f} sec (loop time {duration:.2f} sec)")
-
-    return audio, fs
-
-# ------------------------------------------------------------
-# Wait for trigger – either wake word or spacebar hold
-# ------------------------------------------------------------
-def wait_for_trigger(pre_buffer_duration=PREBUFFER_DURATION, fs=RATE):
+    if AUDIO_SOURCE_FILE:
+        capture = source = FileAudioSource(AUDIO_SOURCE_FILE, realtime=AUDIO_SOURCE_REALTIME)
+        logger.info(f"Replaying {AUDIO_SOURCE_FILE} instead of the microphone")
+    else:
+        input_device, device_fs = get_default_device("input")
+        capture = AudioCapture(device=input_device, samplerate=device_fs, buffer_seconds=CAPTURE_BUFFER_SECONDS)
+        capture.start()
+        source = capture.reader()
+    # a capture thread reads 16kHz frames through one stateful resampler (a no-op if the device already runs at 16kHz)
+    # and pushes them into audio_queue; each stage consumes from that queue through its own reader.
+    # A file replayed faster than real time waits for the stages instead of having its frames dropped.
+    pipeline = AudioPipeline(ResampledReader(source, samplerate=RATE),
+                             frame_length=PIPELINE_FRAME_LENGTH, frame_queue=audio_queue,
+                             backpressure=bool(AUDIO_SOURCE_FILE) and not AUDIO_SOURCE_REALTIME)
+    pipeline.start()
+    stage_streams = {name: pipeline.reader(name) for name in ("wakeword", "vad_record", "push_to_talk", "barge_in")}
+    return capture, pipeline, stage_streams
+
+def start_barge_in_monitor(stage_streams):
+    """Builds the monitor that keeps the wake word armed during HAL's answers (disabled unless BARGE_IN)."""
+    return BargeInMonitor(porcupine, stage_streams["barge_in"], key_events, fs=RATE,
+                          echo_delay=ECHO_DELAY, prebuffer_duration=PREBUFFER_DURATION, enabled=BARGE_IN)
+
+
+
+# ------------------------------------------------------------
+# Startup profiling
+# ------------------------------------------------------------
+def profile_startup(json_path=None):
     """
-    Waits for either the wake word or the Spacebar key to trigger recording.
-    Returns (trigger_type, stream, buffered_audio)
-    - trigger_type: 'wakeword' or 'spacebar'
-    - stream: the active InputStream (to reuse)
-    - buffered_audio: prebuffered audio if wakeword triggered, else None
+    Waits for every startup stage, creates the lazy backends too (the calendar may ask for 2FA),
+    then logs a report sorted by wall time and writes it as JSON to json_path (default LOG_PATH/startup_profile.json).
     """
-    trigger_event = threading.Event()
-    trigger_type = {"value": None}
-    buffered_audio_container = {"audio": None}
-    input_device, device_fs = get_default_device("input")
-
-    # Start spacebar listener in a separate thread
-    def spacebar_listener():
-        def on_press(key):
-            try:
-                if key == keyboard.Key.space:
-                    trigger_type["value"] = "spacebar"
-                    trigger_event.set()
-                    return False
-            except Exception as e:
-                logger.error(f"Spacebar listener exception: {e}")
-
+    json_path = json_path or os.path.join(os.environ["LOG_PATH"], "startup_profile.json")
+    startup.result("porcupine")
+    startup.result("devices")
+    profiler.mark("wake word ready")
+    startup.wait_all()
+    profiler.mark("all startup stages done")
+    for name, started, seconds in startup.timings():
+        profiler.record("stage", name, started, started + seconds)
+
+    for name, proxy in (("spaCy", nlp), ("sports", sports_backend), ("calendar", calendar_backend)):
         try:
-            listener = keyboard.Listener(on_press=on_press)
-            listener.daemon = True
-            listener.start()
+            started, seconds = resolve(proxy)
+            profiler.record("backend", name, started, started + seconds)
         except Exception as e:
-            logger.error(f"pynput error: {e}")
-
-    threading.Thread(target=spacebar_listener, daemon=True).start()
-
-    # Set up prebuffer for wake word, using 16k for the frame rate (since we'll convert to that before extending the buffer)
-    pre_buffer = deque(maxlen=int(pre_buffer_duration * fs))
-
-    logger.info("Listening for wake word or push-to-talk (hold Spacebar)...")
-    stream = sd.InputStream(samplerate=device_fs, channels=1, dtype="int16", device=input_device)
-    stream.start()
-
-    try:
-        while not trigger_event.is_set():
-            # porcupine expects 512 samples, so...
-            # How many samples at device_fs give 512 samples at 16kHz
-            device_frame_length = int(porcupine.frame_length * device_fs / fs)
-
-            # Read that many samples from the device
-            audio_frame, _ = stream.read(device_frame_length)
-            audio_frame = audio_frame.flatten()
-
-            # Now resample to exactly porcupine.frame_length
-            if device_fs != fs:
-                audio_16k = np.interp(
-                    np.linspace(0, len(audio_frame), porcupine.frame_length),
-                    np.arange(len(audio_frame)),
-                    audio_frame
-                ).astype(np.int16)
-            else:
-                audio_16k = audio_frame
-
-            # extend prebuffer with converted audio frame
-            pre_buffer.extend(audio_16k)
-
-            keyword_index = porcupine.process(audio_16k)
-            if keyword_index >= 0:
-                trigger_type["value"] = "wakeword"
-                buffered_audio_container["audio"] = np.array(pre_buffer, dtype=np.float32) / 32768.0
-                trigger_event.set()
-                break
-
-    except KeyboardInterrupt:
-        stream.stop()
-        stream.close()
-        raise
+            logger.error(f"Could not create {name} backend while profiling: {e}")
+    profiler.uninstall()
 
-    return trigger_type["value"], stream, buffered_audio_container["audio"]
+    logger.info(profiler.report())
+    profiler.write_json(json_path)
+    logger.info(f"Startup profile written to {json_path}")
 
 # ------------------------------------------------------------
 # Entry Point
 # ------------------------------------------------------------
 if __name__ == "__main__":
-    run()
\ No newline at end of file
+    if PROFILE_STARTUP:
+        profile_startup()
+    else:
+        run()
\ No newline at end of file
@@ -0,0 +1,133 @@
+import json
+import logging
+import re
+from tools import API_RESPONSE_PREFIX
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None  # falls back to a characters-per-token estimate
+
+logger = logging.getLogger('HAL')
+
+MESSAGE_OVERHEAD_TOKENS = 4  # role and separators the chat format adds to every message
+SUMMARY_LINE_CHARS = 160  # each evicted turn is summarized in at most this much of the user's words and HAL's
+
+
+def load_encoding(model_name):
+    """The tiktoken encoding for the model; other (e.g. Ollama) or unnamed models get o200k_base as an approximation."""
+    if tiktoken is None:
+        return None
+    if model_name and isinstance(model_name, str):
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            pass
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:  # the encoding is downloaded on first use
+        logger.warning(f"tiktoken encoding unavailable ({e}) – estimating token counts")
+        return None
+
+
+def _shorten(text, limit=SUMMARY_LINE_CHARS):
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit].rsplit(" ", 1)[0] + "…"
+
+
+def _first_sentence(text):
+    return re.split(r"(?<=[.!?])\s", text.strip(), maxsplit=1)[0]
+
+
+class HistoryWindow:
+    """
+    Keeps the conversation history within a token budget.
+    Messages are grouped into turns (a user message and everything up to the next one:
+    HAL's replies, tool calls and tool results), and only whole turns are evicted, oldest
+    first, so a tool result never loses the assistant message that asked for it. The
+    current turn is always kept, however large.
+    Evicted turns are folded into a running summary – the user's request and the first
+    sentence of HAL's answer – which is itself capped at summary_tokens, dropping its
+    oldest lines.
+    Once over budget, turns are evicted down to low_water of it, so the history then
+    only grows for a while and the cached prompt prefix stays valid.
+    """
+
+    def __init__(self, model_name, budget_tokens=3000, summary_tokens=300, low_water=0.6):
+        self.budget_tokens = budget_tokens
+        self.summary_tokens = summary_tokens
+        self.low_water = low_water
+        self.encoding = load_encoding(model_name)
+        self.summary_lines = []
+        self._counts = {}  # id(message) -> tokens; messages are counted once, when first seen
+
+    def count_text(self, text):
+        if not text:
+            return 0
+        if self.encoding is None:
+            return len(text) // 4 + 1
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def count_message(self, message):
+        key = id(message)
+        if key not in self._counts:
+            tokens = MESSAGE_OVERHEAD_TOKENS + self.count_text(message.get("content"))
+            if message.get("tool_calls"):
+                tokens += self.count_text(json.dumps(message["tool_calls"]))
+            self._counts[key] = tokens
+        return self._counts[key]
+
+    def count(self, messages):
+        return sum(self.count_message(m) for m in messages)
+
+    @staticmethod
+    def split_turns(messages):
+        turns = []
+        for message in messages:
+            starts_turn = (message["role"] == "user"
+                           and not str(message.get("content", "")).startswith(API_RESPONSE_PREFIX))
+            if starts_turn or not turns:
+                turns.append([])
+            turns[-1].append(message)
+        return turns
+
+    def fit(self, messages):
+        """Returns the messages that fit the budget (evicting and summarizing old turns if needed)."""
+        total = self.count(messages)
+        if total <= self.budget_tokens:
+            return messages
+        turns = self.split_turns(messages)
+        target = self.budget_tokens * self.low_water
+        evicted = 0
+        while len(turns) > 1 and total > target:
+            turn = turns.pop(0)
+            total -= self.count(turn)
+            self._summarize(turn)
+            for message in turn:
+                self._counts.pop(id(message), None)
+            evicted += 1
+        logger.info(f"History over {self.budget_tokens} tokens: {evicted} old turn(s) summarized, {total} tokens kept")
+        return [message for turn in turns for message in turn]
+
+    def _summarize(self, turn):
+        # the user's own words (not API responses) and the first sentence of HAL's final answer
+        request = ""
+        if turn[0]["role"] == "user" and not turn[0].get("content", "").startswith(API_RESPONSE_PREFIX):
+            request = turn[0]["content"]
+        replies = [m.get("content") for m in turn if m["role"] == "assistant" and m.get("content")]
+        answer = _first_sentence(replies[-1]) if replies else ""
+        line = "- " + "; ".join(part for part in (
+            f"User: {_shorten(request)}" if request else "",
+            f"HAL: {_shorten(answer)}" if answer else "",
+        ) if part)
+        if line == "- ":
+            return
+        self.summary_lines.append(line)
+        while len(self.summary_lines) > 1 and self.count_text("\n".join(self.summary_lines)) > self.summary_tokens:
+            self.summary_lines.pop(0)
+
+    def summary_message(self):
+        """The running summary as a system message placed before the history, or None."""
+        if not self.summary_lines:
+            return None
+        return {"role": "system", "content": "Summary of the earlier conversation:\n" + "\n".join(self.summary_lines)}
@@ -0,0 +1,75 @@
+import threading
+import time
+import logging
+from pynput import keyboard
+
+logger = logging.getLogger('HAL')
+
+
+class KeyEventService:
+    """
+    A single pynput keyboard listener for the whole session.
+    It publishes press/release transitions of the push-to-talk key as events
+    (and to any subscribed callbacks), so waiting for a trigger or a release
+    never has to start another listener thread.
+    Auto-repeat presses while the key is held are ignored.
+    """
+
+    def __init__(self, key=keyboard.Key.space):
+        self.key = key
+        self.pressed = threading.Event()  # set on each press; consumers clear it before waiting
+        self.released = threading.Event()  # set on release, cleared on press
+        self.released.set()
+        self.held = False
+        self.last_press_time = None
+        self._subscribers = []
+        self._listener = None
+
+    def start(self):
+        if self._listener is not None:
+            return
+        try:
+            self._listener = keyboard.Listener(on_press=self._on_press, on_release=self._on_release)
+            self._listener.daemon = True
+            self._listener.start()
+        except Exception as e:
+            # e.g. no display/input access on a headless Pi – wake word still works
+            logger.error(f"pynput error, push-to-talk disabled: {e}")
+            self._listener = None
+
+    def stop(self):
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+    def subscribe(self, callback):
+        """callback(event, timestamp) with event "press" or "release"."""
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def _publish(self, event):
+        now = time.time()
+        for callback in list(self._subscribers):
+            try:
+                callback(event, now)
+            except Exception as e:
+                logger.error(f"Key event subscriber failed: {e}")
+
+    def _on_press(self, key):
+        if key != self.key or self.held:
+            return
+        self.held = True
+        self.last_press_time = time.time()
+        self.released.clear()
+        self.pressed.set()
+        self._publish("press")
+
+    def _on_release(self, key):
+        if key != self.key:
+            return
+        self.held = False
+        self.released.set()
+        self._publish("release")
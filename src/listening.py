@@ -0,0 +1,259 @@
+"""
+Listening for a command: waiting for the wake word or the spacebar, then recording
+until the end of speech (or until the spacebar is released).
+
+Kept apart from hal.py so it can be imported without starting HAL's models and
+services (see replay_audio.py); the wake word engine and key listener are passed in.
+"""
+import os
+import time
+import logging
+import numpy as np
+import pvporcupine
+from dotenv import load_dotenv
+from audio_buffers import AudioRing, RecordingBuffer
+from vad import create_endpointer
+
+load_dotenv()
+
+logger = logging.getLogger('HAL')
+
+DEBUG_ON = os.getenv("DEBUG_ON") == "True"
+
+# ------------------------------------------------------------
+# Recording Configuration
+# ------------------------------------------------------------
+RATE = 16000 # must be 16000 for porcupine
+CHUNK_SIZE = 1024
+PREBUFFER_DURATION = 0.8  # seconds of audio to keep before trigger
+SILENCE_DURATION = 0.8 # seconds of silence to wait before stopping recording (VAD_MODE=energy)
+SILENCE_THRESHOLD = float(os.getenv("SILENCE_THRESHOLD")) if os.getenv("SILENCE_THRESHOLD") else None # loudness below which to start silence counter (e.g. 0.001, VAD_MODE=energy)
+VAD_MODE = os.getenv("VAD_MODE", "adaptive") # "adaptive" (noise floor + zcr + hangover) or "energy" (fixed SILENCE_THRESHOLD)
+VAD_FRAME_LENGTH = 512 # samples per VAD decision (32ms at 16kHz)
+END_SILENCE = float(os.getenv("END_SILENCE", 0.5)) # adaptive VAD hangover: seconds of non-speech that end a command
+NO_SPEECH_TIMEOUT = float(os.getenv("NO_SPEECH_TIMEOUT", 4.0)) # stop listening if no speech starts after the wake word
+STT_SEGMENT_PAUSE = float(os.getenv("STT_SEGMENT_PAUSE", 0.25)) # a pause this long (seconds) hands the audio so far to the background transcriber
+MAX_RECORD_DURATION = float(os.getenv("MAX_RECORD_DURATION", 12.0)) # hard stop for wake-word commands (seconds)
+PTT_MAX_DURATION = float(os.getenv("PTT_MAX_DURATION", 30.0)) # hard memory bound for push-to-talk commands (seconds)
+PTT_OVERFLOW_POLICY = os.getenv("PTT_OVERFLOW_POLICY", "stop") # "stop" ends the recording, "keep_latest" drops the oldest audio
+DEVICE_POLL_SECONDS = 1.0 # how often an idle HAL checks for a plugged/unplugged sound card
+
+# ------------------------------------------------------------
+# Shared State for recording
+# ------------------------------------------------------------
+prebuffer = AudioRing(int(PREBUFFER_DURATION * RATE), dtype=np.int16) # ring buffer for prebuffering wake-word audio (16kHz int16)
+def new_endpointer():
+    """A command endpointer built from the configuration above, with a fresh noise floor."""
+    return create_endpointer(VAD_MODE, fs=RATE, frame_length=VAD_FRAME_LENGTH,
+                             silence_threshold=SILENCE_THRESHOLD, silence_duration=SILENCE_DURATION,
+                             end_silence=END_SILENCE, no_speech_timeout=NO_SPEECH_TIMEOUT)
+
+command_endpointer = new_endpointer() # end-of-speech detection for wake word commands
+command_buffer = RecordingBuffer(int((PREBUFFER_DURATION + max(MAX_RECORD_DURATION, PTT_MAX_DURATION)) * RATE)) # reused for every command recording
+
+# ------------------------------------------------------------
+# Porcupine Wake Word Configuration
+# ------------------------------------------------------------
+ACCESS_KEY = os.getenv("PICOVOICE_ACCESS_KEY")
+KEYWORDS = ["computer"]
+KEYWORD_PATHS = os.getenv("KEYWORD_FILE_PATH")
+
+def create_porcupine():
+    return pvporcupine.create(access_key=ACCESS_KEY, keyword_paths=[KEYWORD_PATHS])
+
+# ------------------------------------------------------------
+# Record until silence (used with wake word detection)
+# ------------------------------------------------------------
+def record_until_silence(stream, initial_audio=None, endpointer=None, transcription=None,
+                         fs=RATE, max_duration=MAX_RECORD_DURATION):
+    """
+    Records audio until the endpointer detects the end of speech or max_duration is reached.
+    - initial_audio: int16 numpy array of prebuffered audio (optional)
+    - endpointer: vad.Endpointer deciding when the command is over (defaults to the configured VAD_MODE)
+    - transcription: optional StreamingTranscription; each pause in speech hands it the audio so far
+    - fs: target sample rate (default 16000), must match stream.samplerate
+    - max_duration: hard stop in seconds
+    Returns (audio, fs) where audio is a float32 view of the shared command buffer
+    (valid until the next recording starts).
+    """
+    endpointer = endpointer or command_endpointer
+    recording = get_command_buffer(int((max_duration + PREBUFFER_DURATION) * fs), overflow="stop")
+
+    # Include prebuffer if provided
+    if initial_audio is not None:
+        logger.debug(f"Initial prebuffer length: {len(initial_audio)} samples (~{len(initial_audio)/fs:.2f} sec)")
+        recording.append(initial_audio, scale=1 / 32768.0)
+
+    frame_length = endpointer.frame_length
+    max_frames = int(max_duration * fs / frame_length)
+    pause_frames = max(1, round(STT_SEGMENT_PAUSE * fs / frame_length))
+    frames_recorded = 0
+    endpointer.start()
+
+    logger.info(f"Recording command ({VAD_MODE} endpointing)...")
+    start_time = time.time()
+
+    while True:
+        # Read a frame from stream and convert it straight into the command buffer
+        frame, _ = stream.read(frame_length)
+        frame = recording.append(frame[:, 0], scale=1 / 32768.0)
+        frames_recorded += 1
+
+        if endpointer.process(frame):
+            break
+        if frames_recorded >= max_frames or recording.full:
+            endpointer.finish("max_duration")
+            break
+
+        # the speaker paused mid-command: let the background transcriber start on what we have
+        if transcription is not None and endpointer.in_speech and endpointer.silence_run == pause_frames:
+            transcription.add_segment(recording.view())
+
+        if DEBUG_ON:
+            vad = endpointer.vad
+            logger.debug(f"Frame {frames_recorded}: speech={endpointer.in_speech} silence_run={endpointer.silence_run} "
+                         f"energy={getattr(vad, 'last_energy_db', 0):.1f}dB floor={getattr(vad, 'floor_db', 0):.1f}dB rms={getattr(vad, 'last_rms', 0):.5f}")
+
+    duration = time.time() - start_time
+    audio = recording.view()
+    logger.info(f"Recording complete. Total duration: {len(audio)/fs:.2f} sec (loop time {duration:.2f} sec)")
+    log_endpoint_stats(endpointer.last_stats)
+
+    return audio, fs
+
+def command_speech_end(initial_audio, endpointer=None):
+    """Sample index in the command buffer where the last detected speech ended (None if unknown)."""
+    endpointer = endpointer or command_endpointer
+    if endpointer.last_speech_frame is None:
+        return None
+    offset = len(initial_audio) if initial_audio is not None else 0
+    return offset + endpointer.last_speech_frame * endpointer.frame_length
+
+def log_endpoint_stats(stats):
+    """Log per-turn endpointing timings so the VAD can be tuned."""
+    if not stats:
+        return
+    seconds = {k: "n/a" if stats[k] is None else f"{stats[k]:.2f}s" for k in ("speech_start", "speech_end", "endpoint")}
+    latency = "n/a" if stats["endpoint_latency"] is None else f"{stats['endpoint_latency']*1000:.0f}ms"
+    floor = "" if stats["noise_floor_db"] is None else f", noise floor {stats['noise_floor_db']:.1f} dBFS"
+    logger.info(
+        f"Endpoint ({stats['reason']}): speech {seconds['speech_start']}–{seconds['speech_end']}, "
+        f"endpoint at {seconds['endpoint']}, endpoint latency {latency}{floor}"
+    )
+
+
+# ------------------------------------------------------------
+# Record while spacebar is held 
+# ------------------------------------------------------------
+def record_while_spacebar_held(stream, key_events, fs=RATE, max_duration=PTT_MAX_DURATION, overflow=PTT_OVERFLOW_POLICY):
+    """
+    Records audio while the spacebar is held down.
+    - key_events: the session-wide input_events.KeyEventService
+    Stops immediately when the spacebar is released.
+    The stream must already deliver audio at fs.
+    - max_duration: memory bound in seconds
+    - overflow: what to do once max_duration is reached –
+      "stop" ends the recording, "keep_latest" keeps recording and drops the oldest audio
+    Returns (audio, fs) where audio is a float32 view of the shared command buffer.
+    """
+    recording = get_command_buffer(int(max_duration * fs), overflow=overflow)
+
+    logger.info("Recording command (push-to-talk, hold spacebar)...")
+    start_time = time.time()
+    # key_events.released is set by the session-wide listener (already set if the key was tapped and let go)
+    while not key_events.released.is_set():
+        chunk, _ = stream.read(CHUNK_SIZE)
+        recording.append(chunk[:, 0], scale=1 / 32768.0)
+
+        if recording.full and recording.overflow == "stop":
+            logger.warning(f"Push-to-talk recording hit the {max_duration:.0f} sec limit – stopping")
+            break
+
+    if recording.dropped:
+        logger.warning(f"Push-to-talk recording exceeded {max_duration:.0f} sec – dropped {recording.dropped/fs:.2f} sec ({recording.overflow})")
+
+    duration = time.time() - start_time
+    audio = recording.view()
+    logger.info(f"Recording complete (spacebar released). Total duration: {len(audio)/fs:.2f} sec (loop time {duration:.2f} sec)")
+
+    return audio, fs
+
+def get_command_buffer(max_samples, overflow="stop"):
+    """
+    Returns the shared command buffer, reset and ready for a new recording.
+    Only reallocates if a caller asks for more than it can hold.
+    """
+    global command_buffer
+    if max_samples > command_buffer.capacity:
+        command_buffer = RecordingBuffer(max_samples, overflow=overflow)
+    else:
+        command_buffer.reset(max_samples=max_samples, overflow=overflow)
+    return command_buffer
+
+# ------------------------------------------------------------
+# Wait for trigger – either wake word or spacebar hold
+# ------------------------------------------------------------
+def wait_for_trigger(stream, porcupine, key_events=None, pre_buffer_duration=PREBUFFER_DURATION, fs=RATE,
+                     device_changed=None, endpointer=None):
+    """
+    Waits for either the wake word or the Spacebar key to trigger recording.
+    - stream: a 16kHz pipeline reader (capture keeps running after we return)
+    - porcupine: the wake word engine (see create_porcupine)
+    - key_events: the session-wide input_events.KeyEventService; None listens for the wake word only
+    - device_changed: optional check polled every DEVICE_POLL_SECONDS (e.g. AudioDeviceRegistry.changed)
+    - endpointer: whose VAD learns the room's noise floor while idle (defaults to the configured VAD_MODE)
+    Returns (trigger_type, buffered_audio)
+    - trigger_type: 'wakeword', 'spacebar', or 'device_change' if device_changed() returned True
+    - buffered_audio: int16 view of the prebuffered audio if wakeword triggered, else None
+      (valid until the next call to wait_for_trigger)
+    """
+    trigger_type = None
+    buffered_audio = None
+    endpointer = endpointer or command_endpointer
+
+    # the session-wide key listener sets this on the next spacebar press
+    if key_events is not None:
+        key_events.pressed.clear()
+
+    # Set up prebuffer for wake word, using 16k for the frame rate (since the stream delivers 16k)
+    # the module-level ring is reused, so steady-state listening allocates nothing per frame
+    pre_buffer_len = int(pre_buffer_duration * fs)
+    pre_buffer = prebuffer if pre_buffer_len == prebuffer.capacity else AudioRing(pre_buffer_len, dtype=np.int16)
+    pre_buffer.clear()
+    noise_frame = np.zeros(porcupine.frame_length, dtype=np.float32)
+
+    logger.info("Listening for wake word or push-to-talk (hold Spacebar)...")
+    # don't process whatever was captured while HAL was busy (including HAL's own voice)
+    stream.skip_to_latest()
+    poll_frames = max(1, int(DEVICE_POLL_SECONDS * fs / porcupine.frame_length))
+    frames = 0
+
+    while trigger_type is None:
+        if key_events is not None and key_events.pressed.is_set():
+            trigger_type = "spacebar"
+            break
+
+        frames += 1
+        if device_changed is not None and frames % poll_frames == 0 and device_changed():
+            trigger_type = "device_change"
+            break
+
+        # porcupine expects exactly frame_length (512) samples at 16kHz;
+        # the stream's resampler takes care of the device rate
+        audio_frame, _ = stream.read(porcupine.frame_length)
+        audio_16k = audio_frame[:, 0]
+
+        # copy the frame into the prebuffer ring (one block write, no per-sample objects)
+        pre_buffer.write(audio_16k)
+
+        # let the VAD track the room's noise floor while idle
+        np.multiply(audio_16k, 1 / 32768.0, out=noise_frame)
+        endpointer.vad.observe_noise(noise_frame)
+
+        keyword_index = porcupine.process(audio_16k)
+        if keyword_index >= 0:
+            trigger_type = "wakeword"
+            # zero-copy view of the last pre_buffer_duration seconds
+            buffered_audio = pre_buffer.latest(pre_buffer_len)
+
+    return trigger_type, buffered_audio
@@ -1,6 +1,10 @@
-import subprocess
 import os
-from hal_persona_prompt import prompt as HAL_PERSONA_PROMPT
+import json
+import logging
+import requests
+from hal_persona_prompt import persona_prompt, api_prompt, tool_prompt
+from tools import TOOLS, ToolCall, API_RESPONSE_PREFIX
+from history_window import HistoryWindow
 
 # For OpenAI v1+ usage
 try:
@@ -8,16 +12,44 @@ try:
 except ImportError:
     OpenAI = None  # Ollama mode won't use this
 
-def get_hal_system_message():
-    return {"role": "system", "content": HAL_PERSONA_PROMPT}
+logger = logging.getLogger('HAL')
+
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "-1") # how long Ollama keeps the model loaded after a request ("-1" = until it exits)
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", 8192)) # fixed context size: changing it reloads the model, overflowing it shifts out the cached prefix
+
+class OllamaError(RuntimeError):
+    """An Ollama request failed or its stream broke off; HAL answers with the error instead."""
+
+
+def get_hal_system_message(tool_mode="text"):
+    # native tool calling describes the APIs in the tool schemas, so the long text-protocol part isn't sent
+    return {"role": "system", "content": persona_prompt + (tool_prompt if tool_mode == "native" else api_prompt)}
 
 
 class LLMClient:
-    def __init__(self, backend, model_name, max_history=6, openai_api_key=None):
+    """
+    tool_mode "native" sends tools.TOOLS with each request and reads structured tool calls back;
+    "text" keeps the [EXTERNAL_API_CALL] protocol from the persona prompt, for models without
+    tool support. Either way, the calls HAL should make after a reply are in pending_tool_calls.
+    """
+
+    def __init__(self, backend, model_name, history_tokens=3000, openai_api_key=None, tool_mode=None):
         self.backend = backend
         self.model_name = model_name
-        self.max_history = max_history
         self.chat_history = []
+        self.history = HistoryWindow(model_name, budget_tokens=history_tokens)
+        self.tool_mode = tool_mode or ("native" if backend == "openai" else "text")
+        if self.tool_mode not in ("native", "text"):
+            raise ValueError(f"Unsupported tool mode: {self.tool_mode}")
+        self.tools = TOOLS if self.tool_mode == "native" else None
+        # built once and never changed, so every request starts with the same cacheable prefix
+        # (tools, then system prompt); only the history after it grows
+        self.system_message = get_hal_system_message(self.tool_mode)
+        self.pending_tool_calls = []
+        self.last_usage = {}  # token counts of the last request, see _record_usage()
+        self._ollama_previous = None  # (messages, tokens in Ollama's KV cache afterwards)
+        self._ollama_system_tokens = 0  # size of the system prompt, known after warm_up()
 
         if backend == "openai":
             if OpenAI is None:
@@ -26,53 +58,305 @@ class LLMClient:
                 raise ValueError("OpenAI API key required for OpenAI backend")
             self.client = OpenAI(api_key=openai_api_key)
 
-    def get_response(self, user_input):
+        elif backend == "ollama":
+            # one pooled keep-alive connection to the local Ollama server
+            self.ollama_url = OLLAMA_HOST.rstrip("/")
+            if "://" not in self.ollama_url:
+                self.ollama_url = "http://" + self.ollama_url
+            self.session = requests.Session()
+            self.keep_alive = int(OLLAMA_KEEP_ALIVE) if OLLAMA_KEEP_ALIVE.lstrip("-").isdigit() else OLLAMA_KEEP_ALIVE
+
+    def warm_up(self):
+        """
+        Ollama: load the model now (and pin it with keep_alive) and evaluate the system prompt
+        into its cache, so the first command waits for neither.
+        """
+        if self.backend != "ollama":
+            return
+        try:
+            messages = [self.system_message]
+            payload = {
+                "model": self.model_name,
+                "messages": messages,
+                "stream": False,
+                "keep_alive": self.keep_alive,
+                "options": {"num_predict": 1, "num_ctx": OLLAMA_NUM_CTX},
+            }
+            if self.tools:
+                payload["tools"] = self.tools
+            response = self.session.post(f"{self.ollama_url}/api/chat", json=payload, timeout=300)
+            response.raise_for_status()
+            # only the prompt stays useful for the next request, not the one token generated here
+            self._ollama_system_tokens = response.json().get("prompt_eval_count", 0)
+            self._ollama_previous = (messages, self._ollama_system_tokens)
+            logger.info(f"Ollama model {self.model_name} loaded (keep_alive {self.keep_alive}), "
+                        f"system prompt cached ({self._ollama_system_tokens} tokens)")
+        except requests.RequestException as e:
+            logger.error(f"Ollama warm-up failed: {e}")
+
+    def _add_user_message(self, user_input):
         # Append user input with role 'user'
         self.chat_history.append({"role": "user", "content": user_input})
 
-        # Trim chat history if it grows too long
-        if len(self.chat_history) > self.max_history * 2:
-            self.chat_history = self.chat_history[-self.max_history * 2 :]
+    def _start_turn(self, user_input):
+        # user_input None continues the current turn, e.g. after add_tool_results()
+        if user_input is not None:
+            self.cancel_tool_calls()  # a new turn abandons calls that were never run (e.g. barge-in)
+            self._add_user_message(user_input)
+        # Keep the history within its token budget (checked before every request, since
+        # tool results like a full Wikipedia article can blow it in the middle of a turn)
+        self.chat_history = self.history.fit(self.chat_history)
+        self.pending_tool_calls = []
+
+    def _messages(self):
+        # system prompt, then the summary of evicted turns (changes only when turns are evicted), then the history
+        summary = self.history.summary_message()
+        return [self.system_message] + ([summary] if summary else []) + self.chat_history
+
+    def _finish_turn(self, reply, tool_calls):
+        """Records the assistant message and works out which tool calls HAL has to make."""
+        message = {"role": "assistant", "content": reply}
+        if tool_calls:
+            message["tool_calls"] = [self._tool_call_message(call) for call in tool_calls]
+        elif self.tool_mode == "text":
+            call = ToolCall.from_text(reply)
+            tool_calls = [call] if call else []
+        self.chat_history.append(message)
+        self.pending_tool_calls = tool_calls
+
+    def _tool_call_message(self, call):
+        if self.backend == "openai":
+            arguments = json.dumps(call.arguments)
+            return {"id": call.id, "type": "function", "function": {"name": call.name, "arguments": arguments}}
+        return {"function": {"name": call.name, "arguments": call.arguments}}
+
+    def add_tool_results(self, results):
+        """
+        Feeds the results of pending_tool_calls back to the model as (ToolCall, result text) pairs;
+        follow with get_response() / stream_response() without user input for the answer.
+        Calls without a provider id (text protocol, forced calls) go back as one
+        [EXTERNAL_API_RESPONSE] user message.
+        """
+        untracked = []
+        for call, result in results:
+            if call.id is None:
+                untracked.append(result)
+            elif self.backend == "openai":
+                self.chat_history.append({"role": "tool", "tool_call_id": call.id, "content": result})
+            else:
+                self.chat_history.append({"role": "tool", "tool_name": call.name, "content": result})
+        if untracked:
+            self.chat_history.append({"role": "user", "content": f"{API_RESPONSE_PREFIX} " + "\n\n".join(untracked)})
+        self.pending_tool_calls = []
+
+    def cancel_tool_calls(self, reason="Cancelled by the user."):
+        """
+        Answers pending_tool_calls that won't be run, so the assistant message that asked for
+        them is never left without its tool results (OpenAI rejects such a history).
+        """
+        calls = [call for call in self.pending_tool_calls if call.id is not None]
+        if calls:
+            self.add_tool_results([(call, reason) for call in calls])
+        self.pending_tool_calls = []
+
+    def force_tool_call(self, call):
+        """Makes HAL run a call the model didn't ask for (e.g. a Wikipedia search after "I don't know")."""
+        self.pending_tool_calls = [call]
+
+    def _record_usage(self, prompt_tokens, cached_tokens, completion_tokens):
+        """Logs how much of the prompt the provider served from its cache."""
+        prompt_tokens = prompt_tokens or 0
+        cached_tokens = cached_tokens or 0
+        self.last_usage = {
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "uncached_tokens": prompt_tokens - cached_tokens,
+            "completion_tokens": completion_tokens or 0,
+        }
+        logger.info(f"LLM prompt: {prompt_tokens} tokens ({cached_tokens} cached, {prompt_tokens - cached_tokens} uncached), "
+                    f"reply: {completion_tokens or 0} tokens")
+
+    def _record_openai_usage(self, usage):
+        # OpenAI caches prompt prefixes of 1024+ tokens automatically and reports the hits
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        self._record_usage(usage.prompt_tokens, getattr(details, "cached_tokens", 0), usage.completion_tokens)
+
+    def _record_ollama_usage(self, messages, data):
+        """
+        Ollama reuses its KV cache for the longest prefix it has already evaluated, and
+        prompt_eval_count only counts the tokens it had to evaluate (it is left out when
+        nothing was). It doesn't report the cached part, so that is estimated as everything
+        from the previous request if this request just extends it, else the system prompt.
+        """
+        uncached = data.get("prompt_eval_count", 0)
+        cached = self._ollama_system_tokens
+        if self._ollama_previous is not None:
+            previous_messages, previous_tokens = self._ollama_previous
+            if messages[:len(previous_messages)] == previous_messages:
+                cached = previous_tokens
+        completion = data.get("eval_count", 0)
+        self._record_usage(cached + uncached, cached, completion)
+        self._ollama_previous = (messages, cached + uncached + completion)
+
+    def _openai_chat(self, stream):
+        kwargs = {"tools": self.tools} if self.tools else {}
+        if stream:
+            kwargs["stream_options"] = {"include_usage": True}  # usage arrives in a last chunk without choices
+        return self.client.chat.completions.create(
+            model=self.model_name,
+            messages=self._messages(),
+            max_completion_tokens=512,
+            temperature=1,
+            stream=stream,
+            # route requests with the same prefix to the same cache
+            extra_body={"prompt_cache_key": f"hal-{self.tool_mode}"},
+            **kwargs,
+        )
+
+    def _ollama_chat(self, messages, stream):
+        payload = {
+            "model": self.model_name,
+            "messages": messages,
+            "stream": stream,
+            "keep_alive": self.keep_alive,
+            # the same options on every request, otherwise Ollama reloads the model and the cache is gone
+            "options": {"num_predict": 512, "num_ctx": OLLAMA_NUM_CTX},
+        }
+        if self.tools:
+            payload["tools"] = self.tools
+        return self.session.post(f"{self.ollama_url}/api/chat", json=payload, stream=stream, timeout=(5, 300))
+
+    def _ollama_tool_calls(self, message):
+        # Ollama doesn't give its tool calls ids; number them so results can be matched up
+        return [
+            ToolCall.parse_arguments(tc["function"]["name"], tc["function"].get("arguments"), id=f"call_{i}")
+            for i, tc in enumerate(message.get("tool_calls") or [])
+        ]
+
+    def get_response(self, user_input=None):
+        self._start_turn(user_input)
+        tool_calls = []
 
         if self.backend == "openai":
             # models = self.client.models.list()
             # for model in models.data:
             #     print(model.id)
 
-            system_message = get_hal_system_message()
-            messages = [system_message] + self.chat_history
-
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=messages,
-                max_completion_tokens=512,
-                temperature=1,
-            )
-            reply = response.choices[0].message.content.strip()
-
-            # Append assistant reply
-            self.chat_history.append({"role": "assistant", "content": reply})
-            return reply
+            response = self._openai_chat(stream=False)
+            self._record_openai_usage(response.usage)
+            message = response.choices[0].message
+            reply = (message.content or "").strip()
+            tool_calls = [
+                ToolCall.parse_arguments(tc.function.name, tc.function.arguments, id=tc.id)
+                for tc in message.tool_calls or []
+            ]
 
         elif self.backend == "ollama":
-            prompt = HAL_PERSONA_PROMPT + "\n" + "\n".join(
-                f"{entry['role'].capitalize()}: {entry['content']}" for entry in self.chat_history
-            ) + "\nHAL:"
-
+            messages = self._messages()
             try:
-                result = subprocess.run(
-                    ["ollama", "run", self.model_name, prompt],
-                    capture_output=True,
-                    text=True,
-                    check=True,
-                )
-                reply = result.stdout.strip()
-            except subprocess.CalledProcessError as e:
+                response = self._ollama_chat(messages, stream=False)
+                response.raise_for_status()
+                data = response.json()
+                self._record_ollama_usage(messages, data)
+                message = data["message"]
+                reply = (message.get("content") or "").strip()
+                tool_calls = self._ollama_tool_calls(message)
+            except (requests.RequestException, ValueError, KeyError, TypeError) as e:
+                # connection lost, Ollama restarting, or a reply that isn't the JSON we expect
                 reply = f"Error calling Ollama: {e}"
-
-            # Append assistant reply
-            self.chat_history.append({"role": "assistant", "content": reply})
-            return reply
+                tool_calls = []
 
         else:
             raise ValueError(f"Unsupported backend: {self.backend}")
+
+        # Append assistant reply
+        self._finish_turn(reply, tool_calls)
+        return reply
+
+    def stream_response(self, user_input=None):
+        """
+        Like get_response(), but yields the reply as text deltas while it is generated.
+        The full reply is added to the history once the stream ends – or, if the caller
+        stops early (e.g. barge-in), whatever was generated up to that point.
+        Tool calls are only known once the stream has ended.
+        """
+        self._start_turn(user_input)
+        parts = []
+        tool_calls = []
+        try:
+            if self.backend == "openai":
+                streamed_calls = {}  # index -> [id, name, argument fragments]
+                for chunk in self._openai_chat(stream=True):
+                    if chunk.usage is not None:
+                        self._record_openai_usage(chunk.usage)
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    for tc in delta.tool_calls or []:
+                        call = streamed_calls.setdefault(tc.index, [None, "", []])
+                        if tc.id:
+                            call[0] = tc.id
+                        if tc.function and tc.function.name:
+                            call[1] += tc.function.name
+                        if tc.function and tc.function.arguments:
+                            call[2].append(tc.function.arguments)
+                    if delta.content:
+                        parts.append(delta.content)
+                        yield parts[-1]
+                tool_calls = [
+                    ToolCall.parse_arguments(name, "".join(arguments), id=call_id)
+                    for call_id, name, arguments in (streamed_calls[i] for i in sorted(streamed_calls))
+                ]
+
+            elif self.backend == "ollama":
+                try:
+                    for delta in self._stream_ollama(tool_calls):
+                        parts.append(delta)
+                        yield delta
+                except OllamaError as e:
+                    # drop what was generated before the failure: the turn ends with the error, as a failed request would
+                    parts = [f"Error calling Ollama: {e}"]
+                    tool_calls.clear()
+                    yield parts[0]
+
+            else:
+                raise ValueError(f"Unsupported backend: {self.backend}")
+        finally:
+            self._finish_turn("".join(parts).strip(), tool_calls)
+
+    def _stream_ollama(self, tool_calls):
+        """
+        Yields content deltas; tool calls (which arrive whole) are appended to `tool_calls`.
+        Raises OllamaError if the request fails or the stream breaks off.
+        """
+        messages = self._messages()
+        try:
+            response = self._ollama_chat(messages, stream=True)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            raise OllamaError(e) from e
+        with response:
+            try:
+                # newline-delimited JSON, one message fragment per line
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if data.get("error"):
+                        raise OllamaError(data["error"])
+                    message = data["message"]
+                    for call in self._ollama_tool_calls(message):
+                        call.id = f"call_{len(tool_calls)}"
+                        tool_calls.append(call)
+                    content = message.get("content")
+                    if content:
+                        yield content
+                    if data.get("done"):
+                        self._record_ollama_usage(messages, data)  # the final line carries the counts
+                        return
+            except (requests.RequestException, ValueError, KeyError, TypeError, AttributeError) as e:
+                # the connection dropped (e.g. Ollama restarted) or a line isn't a message chunk
+                raise OllamaError(f"{type(e).__name__}: {e}") from e
+        raise OllamaError("the stream ended before the reply was done")
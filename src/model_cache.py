@@ -0,0 +1,189 @@
+"""
+Load-optimized copies of the models HAL loads at startup.
+
+The first start loads each model the normal way and writes a cached copy next to
+a small signature file (size + mtime of the original). Later starts check the
+signature and load the cached copy instead:
+- Whisper: a plain torch state dict, opened with torch.load(mmap=True) and
+  assigned into a model built on the meta device, so the weights are paged in
+  from the file on demand instead of being unpickled, copied and re-initialized.
+- Piper: the ONNX graph after ONNX Runtime's graph optimizations, loaded with
+  optimizations switched off, so they aren't redone on every start.
+If the original model changes, or anything about the cache looks wrong, the
+cache is rebuilt from the original.
+spaCy isn't cached; load_ner() just loads the only component HAL uses.
+"""
+import os
+import json
+import time
+import logging
+from dataclasses import asdict
+import onnxruntime
+from piper import PiperVoice
+from piper.config import PiperConfig
+
+logger = logging.getLogger('HAL')
+
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", "model-cache")
+
+
+def _signature(path):
+    st = os.stat(path)
+    return {"path": os.path.abspath(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _cache_paths(name, extension):
+    os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+    base = os.path.join(MODEL_CACHE_DIR, name)
+    return base + extension, base + ".json"
+
+
+def _is_fresh(cache_path, meta_path, source_path):
+    if not (os.path.exists(cache_path) and os.path.exists(meta_path)):
+        return False
+    try:
+        with open(meta_path) as f:
+            return json.load(f)["source"] == _signature(source_path)
+    except (OSError, ValueError, KeyError):
+        return False
+
+
+def _write_meta(meta_path, source_path, **extra):
+    with open(meta_path, "w") as f:
+        json.dump({"source": _signature(source_path), **extra}, f)
+
+
+# ------------------------------------------------------------
+# Whisper
+# ------------------------------------------------------------
+def load_whisper(model_name, device="cpu"):
+    """Drop-in for whisper.load_model(model_name) on the CPU, served from the cache when possible."""
+    # imported here so loading the voice doesn't wait for torch
+    import torch
+    import whisper
+
+    if device != "cpu" or model_name not in whisper._MODELS:
+        return whisper.load_model(model_name, device=device)
+
+    download_root = os.path.join(os.getenv("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")), "whisper")
+    source = os.path.join(download_root, os.path.basename(whisper._MODELS[model_name]))
+    cache_path, meta_path = _cache_paths(f"whisper-{model_name}", ".pt")
+
+    start = time.time()
+    if os.path.exists(source) and _is_fresh(cache_path, meta_path, source):
+        try:
+            model = _load_whisper_mmap(cache_path, model_name)
+            logger.info(f"Whisper '{model_name}' memory-mapped from cache in {time.time() - start:.2f}s")
+            return model
+        except Exception as e:
+            logger.warning(f"Whisper cache unusable, rebuilding: {e}")
+
+    model = whisper.load_model(model_name, device="cpu")  # downloads `source` if needed
+    logger.info(f"Whisper '{model_name}' loaded in {time.time() - start:.2f}s, writing cache")
+    try:
+        torch.save({"dims": asdict(model.dims), "model_state_dict": model.state_dict()}, cache_path)
+        _write_meta(meta_path, source)
+    except Exception as e:
+        logger.warning(f"Could not write Whisper cache: {e}")
+    return model
+
+
+def _load_whisper_mmap(path, model_name):
+    import torch
+    import whisper
+    from whisper.model import Whisper, ModelDimensions
+
+    checkpoint = torch.load(path, mmap=True, weights_only=True, map_location="cpu")
+    dims = ModelDimensions(**checkpoint["dims"])
+
+    # build without allocating or initializing weights, then point the parameters at the mapped file
+    with torch.device("meta"):
+        model = Whisper(dims)
+    model.load_state_dict(checkpoint["model_state_dict"], assign=True)
+
+    # non-persistent buffers aren't in the state dict: rebuild them as Whisper.__init__ does
+    model.decoder.register_buffer(
+        "mask", torch.empty(dims.n_text_ctx, dims.n_text_ctx).fill_(-float("inf")).triu_(1), persistent=False
+    )
+    all_heads = torch.zeros(dims.n_text_layer, dims.n_text_head, dtype=torch.bool)
+    all_heads[dims.n_text_layer // 2:] = True
+    model.register_buffer("alignment_heads", all_heads.to_sparse(), persistent=False)
+    if model_name in whisper._ALIGNMENT_HEADS:
+        model.set_alignment_heads(whisper._ALIGNMENT_HEADS[model_name])
+
+    leftover = [name for name, t in list(model.named_parameters()) + list(model.named_buffers()) if t.is_meta]
+    if leftover:
+        raise RuntimeError(f"tensors missing from cache: {', '.join(leftover)}")
+    return model.eval()
+
+
+# ------------------------------------------------------------
+# Piper
+# ------------------------------------------------------------
+def load_piper(model_path, config_path=None):
+    """Drop-in for PiperVoice.load(model_path) that reuses ONNX Runtime's optimized graph across starts."""
+    config_path = config_path or f"{model_path}.json"
+    name = os.path.splitext(os.path.basename(model_path))[0]
+    cache_path, meta_path = _cache_paths(f"piper-{name}.optimized", ".onnx")
+    fresh = _is_fresh(cache_path, meta_path, model_path)
+
+    start = time.time()
+    session = None
+    if fresh:
+        try:
+            session = _piper_session(cache_path)
+        except Exception as e:
+            logger.warning(f"Piper cache unusable, rebuilding: {e}")
+            _remove(cache_path, meta_path)
+            fresh = False
+    if session is None:
+        session = _piper_session(model_path, optimized_path=cache_path)
+        try:
+            _write_meta(meta_path, model_path)
+        except OSError as e:
+            logger.warning(f"Could not write Piper cache: {e}")
+
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = PiperConfig.from_dict(json.load(f))
+    logger.info(f"Piper voice '{name}' loaded in {time.time() - start:.2f}s ({'cached optimized graph' if fresh else 'optimized and cached'})")
+    return PiperVoice(session=session, config=config)
+
+
+def _piper_session(path, optimized_path=None):
+    """
+    With optimized_path, runs ONNX Runtime's graph optimizations and saves the result there;
+    without, loads an already optimized graph as is.
+    """
+    options = onnxruntime.SessionOptions()
+    if optimized_path:
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.optimized_model_filepath = optimized_path
+    else:
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL
+    return onnxruntime.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+def _remove(*paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+# ------------------------------------------------------------
+# spaCy
+# ------------------------------------------------------------
+# only doc.ents is ever read: skip every other component (en_core_web_sm's NER has its own tok2vec)
+NER_EXCLUDE = ["tok2vec", "tagger", "parser", "attribute_ruler", "lemmatizer", "senter"]
+
+def load_ner(model_name="en_core_web_sm"):
+    import spacy
+    nlp = spacy.load(model_name, exclude=NER_EXCLUDE)
+    try:
+        nlp("Dave Bowman flew to Jupiter.")
+    except Exception:
+        # a model version whose NER listens to the shared tok2vec: keep that one
+        nlp = spacy.load(model_name, exclude=[c for c in NER_EXCLUDE if c != "tok2vec"])
+    logger.info(f"spaCy loaded with pipeline {nlp.pipe_names}")
+    return nlp
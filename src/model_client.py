@@ -0,0 +1,219 @@
+"""
+Thin clients for the resident model server (model_server.py).
+
+Messages on the Unix socket are a 4-byte big-endian header length, a JSON
+header, then `payload_bytes` bytes of raw data (float32 audio in, int16
+audio out). Every request uses its own short-lived connection, so requests
+from different threads never interleave and closing the socket cancels a
+synthesis that is still streaming.
+The clients mirror the local objects hal.py already uses (SpeechToText,
+PiperVoice, a spaCy pipeline), so the rest of the code doesn't change.
+If the server dies or restarts mid-session, a client retries once and then
+loads its model locally (see RemoteModel).
+"""
+import os
+import json
+import time
+import socket
+import struct
+import logging
+from types import SimpleNamespace
+import numpy as np
+from speech_to_text import SpeechToText
+
+logger = logging.getLogger('HAL')
+
+MODEL_SERVER_SOCKET = os.getenv("MODEL_SERVER_SOCKET", "/tmp/hal-models.sock")
+SERVER_RETRY_SECONDS = 1.0 # wait before the one retry of a request the server didn't answer (it may be restarting)
+
+_HEADER = struct.Struct(">I")
+
+
+# ------------------------------------------------------------
+# Protocol
+# ------------------------------------------------------------
+def send_message(sock, header, payload=b""):
+    header = dict(header, payload_bytes=len(payload))
+    data = json.dumps(header).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(data)) + data)
+    if payload:
+        sock.sendall(payload)
+
+
+def recv_message(sock):
+    """Returns (header, payload), or (None, b"") if the peer closed the connection."""
+    raw = _recv_exact(sock, _HEADER.size)
+    if raw is None:
+        return None, b""
+    header = json.loads(_recv_exact(sock, _HEADER.unpack(raw)[0]))
+    size = header.get("payload_bytes", 0)
+    payload = _recv_exact(sock, size) if size else b""
+    return header, payload
+
+
+def _recv_exact(sock, size):
+    buf = bytearray(size)
+    view = memoryview(buf)
+    got = 0
+    while got < size:
+        n = sock.recv_into(view[got:])
+        if n == 0:
+            if got == 0:
+                return None
+            raise ConnectionError("Model server closed the connection mid-message")
+        got += n
+    return bytes(buf)
+
+
+class ModelServerClient:
+    def __init__(self, path=MODEL_SERVER_SOCKET, timeout=60.0):
+        self.path = path
+        self.timeout = timeout
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def request(self, header, payload=b""):
+        """One request, one reply. Raises RuntimeError if the server reports an error."""
+        with self.connect() as sock:
+            send_message(sock, header, payload)
+            reply, data = recv_message(sock)
+        return _check(reply), data
+
+    def info(self):
+        return self.request({"op": "info"})[0]
+
+
+def _check(reply):
+    if reply is None:
+        raise ConnectionError("Model server closed the connection")
+    if not reply.get("ok", False):
+        raise RuntimeError(f"Model server error: {reply.get('error')}")
+    return reply
+
+
+def connect_model_server(path=MODEL_SERVER_SOCKET, timeout=60.0):
+    """Returns (client, info) if a model server answers on `path`, else (None, None)."""
+    if not os.path.exists(path):
+        return None, None
+    client = ModelServerClient(path, timeout=timeout)
+    try:
+        return client, client.info()
+    except (OSError, RuntimeError):
+        return None, None
+
+
+# ------------------------------------------------------------
+# Clients
+# ------------------------------------------------------------
+class RemoteModel:
+    """
+    Runs requests on the model server. If the server can't be reached (it died or is
+    restarting) the request is retried once after SERVER_RETRY_SECONDS; if that fails
+    too, `fallback` is called to load the model locally and every later request uses
+    that instead. Without a fallback the connection error is raised.
+    Errors the server reports for a request (RuntimeError) are raised as they are.
+    """
+
+    def __init__(self, client, name, fallback=None):
+        self.client = client
+        self.name = name
+        self.fallback = fallback
+        self.local = None
+
+    def _call(self, remote, local):
+        """remote(): the request on the server; local(model): the same on the local model."""
+        if self.local is None:
+            try:
+                return remote()
+            except OSError as e:  # ConnectionError, FileNotFoundError, timeouts
+                logger.warning(f"Model server didn't answer the {self.name} request ({e}) – retrying")
+            time.sleep(SERVER_RETRY_SECONDS)
+            try:
+                return remote()
+            except OSError as e:
+                self._use_local(e)
+        return local(self.local)
+
+    def _use_local(self, error):
+        if self.fallback is None:
+            raise ConnectionError(f"Model server at {self.client.path} unavailable for {self.name}: {error}") from error
+        logger.error(f"Model server at {self.client.path} unavailable ({error}) – loading the {self.name} model locally")
+        self.local = self.fallback()
+
+
+class RemoteSTT(RemoteModel, SpeechToText):
+    """SpeechToText served by the model server."""
+
+    def __init__(self, client, fallback=None):
+        super().__init__(client, "speech-to-text", fallback)
+
+    def transcribe(self, audio_data, fs=16000, prompt=None):
+        def remote():
+            audio = np.ascontiguousarray(audio_data, dtype=np.float32)
+            reply, _ = self.client.request({"op": "transcribe", "fs": fs, "prompt": prompt}, audio.tobytes())
+            return reply["text"]
+        return self._call(remote, lambda stt: stt.transcribe(audio_data, fs, prompt=prompt))
+
+
+class RemoteVoice(RemoteModel):
+    """The parts of PiperVoice that hal.py uses: .config.sample_rate and synthesize()."""
+
+    def __init__(self, client, info, fallback=None):
+        super().__init__(client, "voice", fallback)
+        self.config = SimpleNamespace(**info["voice"])
+
+    def synthesize(self, text, syn_config=None):
+        """
+        Yields chunks with .audio_int16_bytes as the server produces them.
+        Falls back (as RemoteModel) only if the server fails before the first chunk;
+        a stream that breaks halfway raises.
+        """
+        header = {"op": "synthesize", "text": text}
+        if syn_config is not None:
+            header["syn_config"] = dict(vars(syn_config))
+        opened = self._call(lambda: self._open(header), lambda voice: None) if self.local is None else None
+        if opened is None:
+            yield from self.local.synthesize(text, syn_config=syn_config)
+            return
+        sock, reply, data = opened
+        try:
+            while not reply.get("done"):
+                yield SimpleNamespace(audio_int16_bytes=data, sample_rate=reply["sample_rate"])
+                reply, data = recv_message(sock)
+                _check(reply)
+        finally:
+            # closing early (e.g. barge-in) tells the server to stop synthesizing
+            sock.close()
+
+    def _open(self, header):
+        """Sends the request and waits for the first reply: (sock, reply, data)."""
+        sock = self.client.connect()
+        try:
+            send_message(sock, header)
+            reply, data = recv_message(sock)
+            _check(reply)
+        except BaseException:
+            sock.close()
+            raise
+        return sock, reply, data
+
+
+class RemoteNLP(RemoteModel):
+    """Called like a spaCy pipeline; the returned doc only carries .ents (text, label_)."""
+
+    def __init__(self, client, fallback=None):
+        super().__init__(client, "NER", fallback)
+
+    def __call__(self, text):
+        def remote():
+            reply, _ = self.client.request({"op": "entities", "text": text})
+            return SimpleNamespace(ents=[SimpleNamespace(text=t, label_=label) for t, label in reply["entities"]])
+        return self._call(remote, lambda nlp: nlp(text))
@@ -0,0 +1,166 @@
+"""
+Resident model server: keeps Whisper, the Piper voice and spaCy NER loaded in one
+long-running process and serves them over a Unix-domain socket.
+
+    python model_server.py
+
+hal.py connects automatically when the socket exists (USE_MODEL_SERVER, default True),
+so the voice front-end can be restarted or upgraded without reloading any model,
+and several front-ends can share one copy. Porcupine stays in hal.py: it runs on
+every 32ms audio frame and is cheap to create.
+Protocol and clients: model_client.py.
+"""
+import os
+import sys
+import stat
+import socket
+import socketserver
+import threading
+import logging
+import numpy as np
+from dotenv import load_dotenv
+from piper import SynthesisConfig
+from model_client import MODEL_SERVER_SOCKET, send_message, recv_message
+from model_cache import load_piper, load_ner
+from startup import StartupOrchestrator
+
+load_dotenv()
+
+logger = logging.getLogger('HAL')
+
+VOICE_MODEL_PATH = os.getenv("VOICE_MODEL_PATH", "piper-models/hal.onnx")
+
+
+def create_stt():
+    from whisper_stt import WhisperSTT, QuantizedWhisperSTT, TRANSCRIPTION_BACKEND
+    if TRANSCRIPTION_BACKEND == "local_int8":
+        return QuantizedWhisperSTT()
+    return WhisperSTT()
+
+
+class ModelService:
+    """The loaded models. Each model is used by one request at a time."""
+
+    def __init__(self):
+        startup = StartupOrchestrator()
+        startup.add("stt", create_stt)
+        startup.add("voice", lambda: load_piper(VOICE_MODEL_PATH))
+        startup.add("ner", load_ner)
+        startup.start()
+        self.stt = startup.result("stt")
+        self.voice = startup.result("voice")
+        self.nlp = startup.result("ner")
+        self._locks = {name: threading.Lock() for name in ("stt", "voice", "ner")}
+
+    def info(self):
+        return {
+            "ok": True,
+            "pid": os.getpid(),
+            "models": {
+                "stt": f"{self.stt.backend} {self.stt.model_name}",
+                "voice": os.path.basename(VOICE_MODEL_PATH),
+                "ner": "+".join(self.nlp.pipe_names),
+            },
+            "voice": {"sample_rate": self.voice.config.sample_rate},
+        }
+
+    def transcribe(self, header, payload):
+        audio = np.frombuffer(payload, dtype=np.float32)
+        with self._locks["stt"]:
+            text = self.stt.transcribe(audio, header.get("fs", 16000), prompt=header.get("prompt"))
+        return {"ok": True, "text": text}
+
+    def entities(self, header):
+        with self._locks["ner"]:
+            doc = self.nlp(header["text"])
+        return {"ok": True, "entities": [(ent.text, ent.label_) for ent in doc.ents]}
+
+    def synthesize(self, header, sock):
+        """Streams one message per audio chunk, then {"done": true}. Stops if the client hangs up."""
+        syn_config = SynthesisConfig(**header["syn_config"]) if header.get("syn_config") else None
+        with self._locks["voice"]:
+            for chunk in self.voice.synthesize(header["text"], syn_config=syn_config):
+                send_message(sock, {"ok": True, "sample_rate": chunk.sample_rate}, chunk.audio_int16_bytes)
+        send_message(sock, {"ok": True, "done": True})
+
+
+class RequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        service = self.server.service
+        sock = self.request
+        try:
+            header, payload = recv_message(sock)
+            if header is None:
+                return
+            op = header.get("op")
+            if op == "info":
+                send_message(sock, service.info())
+            elif op == "transcribe":
+                send_message(sock, service.transcribe(header, payload))
+            elif op == "entities":
+                send_message(sock, service.entities(header))
+            elif op == "synthesize":
+                service.synthesize(header, sock)
+            else:
+                send_message(sock, {"ok": False, "error": f"unknown op: {op}"})
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client went away, e.g. barge-in cancelled a synthesis
+        except Exception as e:
+            logger.error(f"Model server request failed: {e}")
+            try:
+                send_message(sock, {"ok": False, "error": str(e)})
+            except OSError:
+                pass
+
+
+class ModelServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, service):
+        self.service = service
+        super().__init__(path, RequestHandler)
+
+    def server_bind(self):
+        # bind() creates the socket file: make it owner-only from the start rather than chmod it afterwards
+        old_umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(old_umask)
+
+
+def remove_stale_socket(path):
+    """Remove a socket file left behind by a server that is no longer running; refuse if one still answers."""
+    if not os.path.exists(path):
+        return
+    if not stat.S_ISSOCK(os.stat(path).st_mode):
+        raise RuntimeError(f"{path} exists and is not a socket")
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+        raise RuntimeError(f"A model server is already running on {path}")
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.remove(path)
+    finally:
+        probe.close()
+
+
+def main(path=MODEL_SERVER_SOCKET):
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO,
+                        format="%(asctime)s %(name)s %(levelname).5s :: %(message)s")
+    remove_stale_socket(path)
+    service = ModelService()
+    server = ModelServer(path, service)
+    logger.info(f"Model server ready on {path}: {service.info()['models']}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Replays recorded commands through HAL's wake word detection and endpointing,
+so detection and endpoint latency can be measured deterministically.
+
+    python replay_audio.py recordings/ [more.wav ...] [--realtime] [--json results.json]
+
+Each WAV/FLAC file is read through a FileAudioSource and the same 16kHz
+resampler hal.py uses, then fed to listening.wait_for_trigger() and
+listening.record_until_silence() unchanged. A file may contain several commands;
+every wake word found is reported. Times are seconds of audio from the
+start of the file.
+Only the wake word engine is created (with the same .env settings as hal.py);
+no other models or services are loaded.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+from audio_capture import FileAudioSource
+from resampler import ResampledReader
+import listening
+
+AUDIO_EXTENSIONS = (".wav", ".flac")
+
+
+def find_audio_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith(AUDIO_EXTENSIONS):
+                    files.append(os.path.join(path, name))
+        else:
+            files.append(path)
+    return files
+
+
+def replay_file(path, porcupine, realtime=False):
+    """Returns one result dict per wake word detected in the file."""
+    source = FileAudioSource(path, realtime=realtime)
+    stream = ResampledReader(source, samplerate=listening.RATE)
+    endpointer = listening.new_endpointer()  # each file starts from the same noise floor, whatever was replayed before
+    results = []
+    try:
+        while True:
+            start = time.time()
+            trigger_type, buffered_audio = listening.wait_for_trigger(stream, porcupine, endpointer=endpointer)
+            detected_at = source.position
+            detection_time = time.time() - start
+
+            listening.record_until_silence(stream, buffered_audio, endpointer=endpointer)
+            stats = dict(endpointer.last_stats)
+            results.append({
+                "file": path,
+                "trigger": trigger_type,
+                "detected_at": round(detected_at, 3),
+                "speech_start": _absolute(detected_at, stats["speech_start"]),
+                "speech_end": _absolute(detected_at, stats["speech_end"]),
+                "endpoint": _absolute(detected_at, stats["endpoint"]),
+                "endpoint_reason": stats["reason"],
+                "endpoint_latency": stats["endpoint_latency"],
+                "noise_floor_db": stats["noise_floor_db"],
+                "detection_wall_time": round(detection_time, 3),
+                "record_wall_time": round(stats["wall_time"], 3),
+            })
+    except EOFError:
+        pass
+    finally:
+        source.close()
+    return results
+
+
+def _absolute(offset, seconds):
+    return None if seconds is None else round(offset + seconds, 3)
+
+
+def summarize(files, results):
+    print(f"\n{len(results)} command(s) detected in {len(files)} file(s)")
+    missed = sorted(set(files) - {r["file"] for r in results})
+    for path in missed:
+        print(f"  no wake word: {path}")
+    latencies = [r["endpoint_latency"] for r in results if r["endpoint_latency"] is not None]
+    if latencies:
+        latencies.sort()
+        print(f"endpoint latency: mean {sum(latencies)/len(latencies)*1000:.0f}ms, "
+              f"median {latencies[len(latencies)//2]*1000:.0f}ms, max {latencies[-1]*1000:.0f}ms")
+    reasons = {}
+    for r in results:
+        reasons[r["endpoint_reason"]] = reasons.get(r["endpoint_reason"], 0) + 1
+    if reasons:
+        print("endpoint reasons: " + ", ".join(f"{k} {v}" for k, v in sorted(reasons.items())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded commands through wake word detection and endpointing.")
+    parser.add_argument("paths", nargs="+", help="WAV/FLAC files or directories of them")
+    parser.add_argument("--realtime", action="store_true", help="pace playback like a live microphone")
+    parser.add_argument("--json", help="write all results to this file")
+    args = parser.parse_args()
+
+    files = find_audio_files(args.paths)
+    if not files:
+        sys.exit("No audio files found")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname).5s :: %(message)s")
+    porcupine = listening.create_porcupine()
+    results = []
+    try:
+        for path in files:
+            file_results = replay_file(path, porcupine, realtime=args.realtime)
+            for r in file_results:
+                latency = "n/a" if r["endpoint_latency"] is None else f"{r['endpoint_latency']*1000:.0f}ms"
+                print(f"{os.path.basename(path)}: wake word at {r['detected_at']:.2f}s, "
+                      f"endpoint at {r['endpoint']:.2f}s ({r['endpoint_reason']}, latency {latency})")
+            results.extend(file_results)
+    finally:
+        porcupine.delete()
+
+    summarize(files, results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+from functools import lru_cache
+from math import gcd, ceil
+import numpy as np
+from scipy.signal import firwin
+
+
+@lru_cache(maxsize=None)
+def _design_polyphase(up, down):
+    """
+    Design the anti-aliasing FIR for an up/down rational resampler and split it
+    into `up` polyphase branches (same design as scipy's resample_poly).
+    Returns an (up, taps_per_phase) float32 array with each branch time-reversed,
+    so a branch can be applied as a plain dot product against a window of input.
+    Cached, so every stream at the same device rate shares one filter.
+    """
+    max_rate = max(up, down)
+    if max_rate == 1:
+        return np.ones((1, 1), dtype=np.float32)  # same rate: identity
+    half_len = 10 * max_rate
+    h = firwin(2 * half_len + 1, 1.0 / max_rate, window=("kaiser", 5.0)) * up
+
+    taps_per_phase = ceil(len(h) / up)
+    padded = np.zeros(taps_per_phase * up)
+    padded[:len(h)] = h
+    poly = padded.reshape(taps_per_phase, up).T  # poly[p, j] = h[p + j * up]
+    return np.ascontiguousarray(poly[:, ::-1], dtype=np.float32)
+
+
+class StreamingResampler:
+    """
+    Rational polyphase resampler that keeps its filter history between calls,
+    so consecutive chunks join without discontinuities.
+    Input and output buffers are preallocated and only grow if a larger chunk arrives.
+    """
+
+    def __init__(self, in_rate, out_rate):
+        g = gcd(int(in_rate), int(out_rate))
+        self.in_rate = int(in_rate)
+        self.out_rate = int(out_rate)
+        self.up = self.out_rate // g
+        self.down = self.in_rate // g
+        self._poly = _design_polyphase(self.up, self.down)
+        self._taps = self._poly.shape[1]
+        self._x = np.zeros(self._taps - 1, dtype=np.float32)  # history + current chunk
+        self._out = np.zeros(0, dtype=np.float32)
+        self._t = 0  # position of the next output sample, in 1/up input samples, relative to the chunk start
+
+    def reset(self):
+        self._x[:self._taps - 1] = 0
+        self._t = 0
+
+    def max_output(self, n_in):
+        """Upper bound on the number of output samples for an input chunk of n_in samples."""
+        return ceil(n_in * self.up / self.down) + 1
+
+    def process(self, chunk):
+        """
+        Resample a 1D chunk (any numeric dtype, float scale is preserved).
+        Returns a float32 view into an internal buffer, valid until the next call.
+        """
+        n_in = len(chunk)
+        hist = self._taps - 1
+
+        # lay out [history | chunk] in the preallocated input buffer
+        if len(self._x) < hist + n_in:
+            grown = np.zeros(hist + n_in, dtype=np.float32)
+            grown[:hist] = self._x[:hist]
+            self._x = grown
+        x = self._x[:hist + n_in]
+        x[hist:] = chunk
+
+        span = n_in * self.up
+        n_out = ceil((span - self._t) / self.down) if span > self._t else 0
+        if len(self._out) < n_out:
+            self._out = np.zeros(self.max_output(n_in), dtype=np.float32)
+        out = self._out[:n_out]
+
+        if n_out:
+            windows = np.lib.stride_tricks.sliding_window_view(x, self._taps)
+            # outputs that share a filter phase are `up` apart and step `down` input samples
+            for r in range(min(self.up, n_out)):
+                t = self._t + r * self.down
+                n, phase = divmod(t, self.up)
+                count = len(range(r, n_out, self.up))
+                np.matmul(windows[n:n + (count - 1) * self.down + 1:self.down], self._poly[phase], out=out[r::self.up])
+
+        self._t += n_out * self.down - span
+
+        # keep the tail as history for the next chunk
+        x[:hist] = x[n_in:n_in + hist]
+        return out
+
+
+class ResampledReader:
+    """
+    Wraps a capture reader running at the device rate and delivers exactly the
+    requested number of samples at `samplerate`, with the same
+    read(frames) -> (data, overflowed) contract as sd.InputStream.read().
+    One instance is shared by wake-word detection and both recording modes,
+    so the resampler state carries across the trigger -> recording boundary.
+    """
+
+    def __init__(self, stream, samplerate=16000):
+        self.stream = stream
+        self.samplerate = int(samplerate)
+        self.passthrough = int(stream.samplerate) == self.samplerate
+        self.resampler = None if self.passthrough else StreamingResampler(stream.samplerate, self.samplerate)
+        self._pending = np.zeros(0, dtype=np.float32)  # resampled samples not yet handed out
+        self._count = 0
+        self._float = np.zeros(0, dtype=np.float32)
+        self._out = np.zeros((0, 1), dtype=np.int16)
+
+    def skip_to_latest(self):
+        self.stream.skip_to_latest()
+        self._count = 0
+        if self.resampler is not None:
+            self.resampler.reset()
+
+    def read(self, frames):
+        if self.passthrough:
+            return self.stream.read(frames)
+
+        overflowed = False
+        while self._count < frames:
+            needed = frames - self._count
+            n_in = max(1, ceil(needed * self.resampler.in_rate / self.samplerate))
+            chunk, chunk_overflowed = self.stream.read(n_in)
+            overflowed = overflowed or chunk_overflowed
+
+            resampled = self.resampler.process(chunk[:, 0])
+            end = self._count + len(resampled)
+            if len(self._pending) < end:
+                grown = np.zeros(end + frames, dtype=np.float32)
+                grown[:self._count] = self._pending[:self._count]
+                self._pending = grown
+            self._pending[self._count:end] = resampled
+            self._count = end
+
+        if len(self._out) < frames:
+            self._float = np.zeros(frames, dtype=np.float32)
+            self._out = np.zeros((frames, 1), dtype=np.int16)
+        tmp = self._float[:frames]
+        out = self._out[:frames]
+
+        np.rint(self._pending[:frames], out=tmp)
+        np.clip(tmp, -32768, 32767, out=tmp)
+        out[:, 0] = tmp
+
+        # shift leftovers to the front
+        leftover = self._count - frames
+        self._pending[:leftover] = self._pending[frames:self._count]
+        self._count = leftover
+        return out, overflowed
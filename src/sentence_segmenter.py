@@ -0,0 +1,58 @@
+import re
+
+# words whose trailing period doesn't end a sentence
+ABBREVIATIONS = {
+    "mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "mt", "vs", "etc", "e.g", "i.e", "approx",
+    "no", "vol", "fig", "jan", "feb", "mar", "apr", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec",
+    "u.s", "u.k", "a.m", "p.m",
+}
+
+# end punctuation (plus any closing quotes/brackets) followed by whitespace
+_BOUNDARY = re.compile(r"([.!?…]+[\"')\]”’]*)\s+|\n+")
+
+
+class SentenceSegmenter:
+    """
+    Splits streamed text into complete sentences as soon as they can be known.
+    feed() takes the next piece of text and returns the sentences it completed;
+    flush() returns whatever is left once the stream has ended.
+    A boundary is only accepted once the whitespace after it has arrived, so
+    "3." in "3.5" or "Dr." before a name don't cut a sentence short.
+    Sentences shorter than min_chars are joined with the next one, so the voice
+    doesn't get a separate utterance for "Yes."
+    """
+
+    def __init__(self, min_chars=12):
+        self.min_chars = min_chars
+        self._buffer = ""  # text after the last sentence handed out (rescanned on each feed; it's short)
+
+    def feed(self, text):
+        self._buffer += text
+        sentences = []
+        start = 0
+        for match in _BOUNDARY.finditer(self._buffer):
+            end = match.end(1) if match.group(1) else match.start()
+            candidate = self._buffer[start:end].strip()
+            if match.group(1) and match.group(1).startswith(".") and self._is_abbreviation(candidate):
+                continue
+            if len(candidate) < self.min_chars and match.group(1):
+                continue  # too short on its own: keep going and speak it with the next sentence
+            if candidate:
+                sentences.append(candidate)
+            start = match.end()
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self):
+        rest = self._buffer.strip()
+        self._buffer = ""
+        return rest
+
+    @staticmethod
+    def _is_abbreviation(text):
+        words = text.split()
+        if not words:
+            return False
+        word = words[-1].rstrip(".").lower()
+        # single letters are initials ("J. R. R. Tolkien")
+        return word in ABBREVIATIONS or (len(word) == 1 and word.isalpha())
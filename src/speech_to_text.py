@@ -1,4 +1,92 @@
+import threading
+import queue
+import time
+
+
 class SpeechToText:
     def listen(self):
         """Listen and return transcribed text."""
         raise NotImplementedError()
+
+    def transcribe(self, audio_data, fs=16000, prompt=None):
+        """
+        audio_data: 1D numpy array float32, fs sample rate
+        prompt: optional text preceding this audio (helps continuity between segments)
+        Returns: text transcription
+        """
+        raise NotImplementedError()
+
+    def start_stream(self, fs=16000, min_segment=1.0):
+        """Begin an incremental transcription of a recording that is still in progress."""
+        return StreamingTranscription(self, fs=fs, min_segment=min_segment)
+
+
+class StreamingTranscription:
+    """
+    Transcribes a recording piece by piece while it is still being captured.
+    The recorder calls add_segment() whenever the speaker pauses; everything up to
+    that point is transcribed on a background thread. When the endpoint fires,
+    finalize() only has to transcribe the audio after the last pause.
+    All positions refer to the same growing recording (e.g. a RecordingBuffer view).
+    """
+
+    def __init__(self, stt, fs=16000, min_segment=1.0):
+        self.stt = stt
+        self.fs = fs
+        self.min_segment_samples = int(min_segment * fs)
+        self.texts = []
+        self.committed = 0  # samples already queued for transcription
+        self.segment_times = []  # seconds spent on each background segment
+        self.final_time = None  # seconds spent transcribing after the endpoint
+        self._error = None
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def add_segment(self, audio):
+        """
+        audio: the recording so far. Queues audio[committed:] for background
+        transcription if it's long enough to be worth a Whisper pass.
+        """
+        end = len(audio)
+        if end - self.committed < self.min_segment_samples:
+            return False
+        self._queue.put(audio[self.committed:end])
+        self.committed = end
+        return True
+
+    def _run(self):
+        while True:
+            segment = self._queue.get()
+            if segment is None:
+                break
+            start = time.time()
+            try:
+                text = self.stt.transcribe(segment, self.fs, prompt=" ".join(self.texts) or None)
+            except Exception as e:
+                text = None
+                self._error = e
+            self.texts.append((text or "").strip())
+            self.segment_times.append(time.time() - start)
+
+    def finalize(self, audio, speech_end=None):
+        """
+        audio: the complete recording. Waits for background segments,
+        transcribes whatever is left, and returns the full transcript.
+        speech_end: sample index where speech ended, if known – a tail that is
+        only trailing silence is skipped (Whisper tends to hallucinate on silence).
+        """
+        self._queue.put(None)
+        self._worker.join()
+
+        if self._error is not None:
+            # a background segment failed: fall back to a single pass over everything
+            return self.stt.transcribe(audio, self.fs)
+
+        start = time.time()
+        tail = audio[self.committed:]
+        if len(tail) and (speech_end is None or speech_end > self.committed):
+            text = self.stt.transcribe(tail, self.fs, prompt=" ".join(self.texts) or None)
+            self.texts.append((text or "").strip())
+        self.final_time = time.time() - start
+        return " ".join(t for t in self.texts if t)
@@ -0,0 +1,133 @@
+import threading
+import time
+import logging
+
+logger = logging.getLogger('HAL')
+
+
+class StartupStage:
+    def __init__(self, name, factory, after=()):
+        self.name = name
+        self.factory = factory
+        self.after = tuple(after)
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.started = None
+        self.duration = None
+
+
+class StartupOrchestrator:
+    """
+    Loads independent models in parallel, one worker thread per stage.
+    A stage starts once the stages listed in `after` are done; its factory
+    is called with no arguments and its return value becomes the stage result.
+    result(name) blocks until that stage is ready, so later work is gated on
+    exactly what it needs instead of on the whole startup.
+    """
+
+    def __init__(self):
+        self._stages = {}
+        self._start_time = None
+
+    def add(self, name, factory, after=()):
+        if name in self._stages:
+            raise ValueError(f"Duplicate startup stage: {name}")
+        self._stages[name] = StartupStage(name, factory, after)
+
+    def start(self):
+        self._start_time = time.perf_counter()
+        for stage in self._stages.values():
+            threading.Thread(target=self._run, args=(stage,), name=f"startup-{stage.name}", daemon=True).start()
+
+    def ready(self, name):
+        stage = self._stages[name]
+        return stage.done.is_set() and stage.error is None
+
+    def result(self, name, timeout=None):
+        stage = self._stages[name]
+        if not stage.done.wait(timeout):
+            raise TimeoutError(f"Startup stage '{name}' not ready after {timeout}s")
+        if stage.error is not None:
+            raise RuntimeError(f"Startup stage '{name}' failed: {stage.error}") from stage.error
+        return stage.result
+
+    def proxy(self, name):
+        """A stand-in for the stage's result that waits for it on first use."""
+        return LazyProxy(lambda: self.result(name), name)
+
+    def wait_all(self, timeout=None):
+        for name in self._stages:
+            self._stages[name].done.wait(timeout)
+
+    def timings(self):
+        """(name, started, seconds) for every finished stage; started is a time.perf_counter() value."""
+        return [(s.name, s.started, s.duration) for s in self._stages.values() if s.duration is not None]
+
+    def _run(self, stage):
+        try:
+            for dependency in stage.after:
+                self.result(dependency)
+            stage.started = time.perf_counter()
+            stage.result = stage.factory()
+            stage.duration = time.perf_counter() - stage.started
+            logger.info(f"Startup: {stage.name} ready in {stage.duration:.2f}s "
+                        f"({time.perf_counter() - self._start_time:.2f}s after start)")
+        except BaseException as e:
+            stage.error = e
+            logger.error(f"Startup: {stage.name} failed: {e}")
+        finally:
+            stage.done.set()
+
+
+class LazyProxy:
+    """
+    Forwards attribute access (and calls) to an object that is created on first use.
+    `resolve` is called once, under a lock; later accesses go straight to the cached object.
+    """
+
+    def __init__(self, resolve, name):
+        object.__setattr__(self, "_resolve", resolve)
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_target", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+        object.__setattr__(self, "_timing", None)  # (started, seconds) once resolved
+
+    def _get(self):
+        target = self._target
+        if target is None:
+            with self._lock:
+                if self._target is None:
+                    start = time.perf_counter()
+                    object.__setattr__(self, "_target", self._resolve())
+                    object.__setattr__(self, "_timing", (start, time.perf_counter() - start))
+                    logger.debug(f"{self._name} resolved in {self._timing[1]:.2f}s")
+                target = self._target
+        return target
+
+    @property
+    def loaded(self):
+        return self._target is not None
+
+    def __getattr__(self, attr):
+        return getattr(self._get(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._get(), attr, value)
+
+    def __call__(self, *args, **kwargs):
+        return self._get()(*args, **kwargs)
+
+    def __repr__(self):
+        return f"<LazyProxy {self._name}{'' if self.loaded else ' (not loaded)'}>"
+
+
+def lazy(factory, name):
+    """Defer a rarely used backend until something actually touches it."""
+    return LazyProxy(factory, name)
+
+
+def resolve(proxy):
+    """Create the object behind a proxy now; returns (started, seconds) of that first resolution."""
+    proxy._get()
+    return proxy._timing
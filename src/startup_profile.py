@@ -0,0 +1,99 @@
+"""
+Startup profiling for `python hal.py --profile-startup`.
+
+Times the first import of every top-level package (inclusive of whatever it imports in turn),
+every startup stage (model loads, backend constructors) and the lazily
+created backends, then writes a sorted text report and a JSON file so
+cold-start regressions show up when dependencies or models change.
+"""
+import builtins
+import json
+import sys
+import threading
+import time
+
+
+class StartupProfiler:
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.entries = []  # {"kind", "name", "seconds", "start"}
+        self._seen_imports = set()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._original_import = None
+
+    # ---------------- imports ----------------
+    def install(self):
+        """Start timing imports. Call before the modules of interest are imported."""
+        if self._original_import is None:
+            self._original_import = builtins.__import__
+            builtins.__import__ = self._timed_import
+
+    def uninstall(self):
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        top = name.partition(".")[0]
+        if level or not top or top in sys.modules or top in self._seen_imports:
+            return self._original_import(name, globals, locals, fromlist, level)
+
+        # times are inclusive: torch imported by whisper counts for both, with "within" naming the importer
+        stack = self._local.__dict__.setdefault("stack", [])
+        within = stack[-1] if stack else None
+        stack.append(top)
+        start = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            stack.pop()
+            with self._lock:
+                if top not in self._seen_imports:
+                    self._seen_imports.add(top)
+                    self._add("import", top, start, time.perf_counter(), within=within)
+
+    # ---------------- everything else ----------------
+    def record(self, kind, name, start, end):
+        """start/end: time.perf_counter() values."""
+        with self._lock:
+            self._add(kind, name, start, end)
+
+    def mark(self, name):
+        """A point in time worth reporting (e.g. 'online')."""
+        now = time.perf_counter()
+        self.record("milestone", name, now, now)
+
+    def _add(self, kind, name, start, end, within=None):
+        self.entries.append({
+            "kind": kind,
+            "name": name,
+            "seconds": round(end - start, 4),
+            "start": round(start - self.origin, 4),
+            "within": within,
+        })
+
+    # ---------------- output ----------------
+    def report(self, top=40):
+        lines = [f"Startup profile ({time.perf_counter() - self.origin:.2f}s since profiling began)"]
+        for e in [e for e in self.entries if e["kind"] == "milestone"]:
+            lines.append(f"  {e['name']:<34} at {e['start']:7.2f}s")
+        timed = sorted((e for e in self.entries if e["kind"] != "milestone"), key=lambda e: e["seconds"], reverse=True)
+        lines.append(f"  {'kind':<10}{'name':<24}{'seconds':>9}{'start':>9}  within")
+        for e in timed[:top]:
+            lines.append(f"  {e['kind']:<10}{e['name']:<24}{e['seconds']:9.3f}{e['start']:9.2f}  {e['within'] or ''}")
+        if len(timed) > top:
+            lines.append(f"  ... {len(timed) - top} more in the JSON file")
+        return "\n".join(lines)
+
+    def write_json(self, path):
+        data = {
+            "python": sys.version.split()[0],
+            "total_seconds": round(time.perf_counter() - self.origin, 4),
+            "entries": sorted(self.entries, key=lambda e: e["seconds"], reverse=True),
+        }
+        with open(path, "w") as f:
+            json.dump(data, f, indent=2)
+
+
+profiler = StartupProfiler()
@@ -0,0 +1,130 @@
+import json
+import pytest
+
+requests = pytest.importorskip("requests")
+
+import llm_client
+from llm_client import LLMClient
+from tools import ToolCall
+
+
+class FakeResponse:
+    """A streamed or plain Ollama /api/chat response; `error` is raised after the given lines."""
+
+    def __init__(self, lines=(), body=None, error=None):
+        self.lines = [json.dumps(line).encode() if isinstance(line, dict) else line for line in lines]
+        self.body = body
+        self.error = error
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.body
+
+    def iter_lines(self):
+        yield from self.lines
+        if self.error:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeSession:
+    def __init__(self):
+        self.responses = []
+
+    def post(self, url, json=None, **kwargs):
+        return self.responses.pop(0)
+
+
+class FakeOpenAI:
+    def __init__(self, api_key=None, **kwargs):
+        self.api_key = api_key
+
+
+@pytest.fixture
+def make_client(monkeypatch):
+    """Builds a real LLMClient for either backend, with fakes in place of the network clients."""
+    monkeypatch.setattr(llm_client, "OpenAI", FakeOpenAI)
+    monkeypatch.setattr(llm_client.requests, "Session", FakeSession)
+
+    def make(backend):
+        if backend == "openai":
+            return LLMClient("openai", "gpt-4o-mini", openai_api_key="test-key")
+        return LLMClient("ollama", "llama3")
+    return make
+
+
+@pytest.mark.parametrize("backend", ["openai", "ollama"])
+def test_abandoned_tool_calls_are_answered_before_next_turn(make_client, backend):
+    client = make_client(backend)
+    assert client.tool_mode == ("native" if backend == "openai" else "text")
+    client._start_turn("What's the weather in Paris?")
+    call = ToolCall("get_current_weather", {"city": "Paris"}, id="call_0")
+    client._finish_turn("", [call])
+    assert client.pending_tool_calls == [call]
+
+    # barge-in: the calls are never run, the user speaks again
+    client._start_turn("Never mind. What time is it?")
+
+    roles = [m["role"] for m in client.chat_history]
+    assert roles == ["user", "assistant", "tool", "user"]
+    assert "Cancelled" in client.chat_history[2]["content"]
+    if backend == "openai":
+        assert client.chat_history[2]["tool_call_id"] == "call_0"
+    assert client.pending_tool_calls == []
+
+
+def test_forced_call_is_dropped_without_a_message(make_client):
+    client = make_client("ollama")
+    client._start_turn("Who was Alan Turing?")
+    client._finish_turn("I don't know.", [])
+    client.force_tool_call(ToolCall("wikipedia_search", {"query": "Alan Turing"}))
+
+    client._start_turn("Okay, forget it.")
+
+    assert [m["role"] for m in client.chat_history] == ["user", "assistant", "user"]
+    assert client.pending_tool_calls == []
+
+
+@pytest.fixture
+def ollama_client(make_client):
+    return make_client("ollama")
+
+
+def test_ollama_stream_broken_midway_ends_turn_with_error(ollama_client):
+    ollama_client.session.responses.append(FakeResponse(
+        lines=[{"message": {"role": "assistant", "content": "I am "}, "done": False}],
+        error=requests.ConnectionError("connection reset"),
+    ))
+
+    deltas = list(ollama_client.stream_response("Are you there?"))
+
+    assert deltas[0] == "I am "
+    assert deltas[-1].startswith("Error calling Ollama:")
+    assert ollama_client.chat_history[-1] == {"role": "assistant", "content": deltas[-1]}
+    assert ollama_client.pending_tool_calls == []
+
+
+@pytest.mark.parametrize("line", [b"not json", {"done": False}])
+def test_ollama_stream_malformed_line_ends_turn_with_error(ollama_client, line):
+    ollama_client.session.responses.append(FakeResponse(lines=[line]))
+
+    deltas = list(ollama_client.stream_response("Hello HAL"))
+
+    assert len(deltas) == 1 and deltas[0].startswith("Error calling Ollama:")
+    assert [m["role"] for m in ollama_client.chat_history] == ["user", "assistant"]
+
+
+def test_ollama_reply_without_message_is_an_error(ollama_client):
+    ollama_client.session.responses.append(FakeResponse(body={"done": True}))
+
+    reply = ollama_client.get_response("Hello HAL")
+
+    assert reply.startswith("Error calling Ollama:")
+    assert ollama_client.pending_tool_calls == []
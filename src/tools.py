@@ -0,0 +1,172 @@
+"""
+HAL's external APIs declared once as tool schemas (OpenAI / Ollama function-calling format).
+
+Each tool maps onto the (api_type, params) command that hal.handle_api_call()
+already executes, so the native tool path and the [EXTERNAL_API_CALL] text
+fallback share one implementation.
+"""
+import json
+import shlex
+
+API_CALL_PREFIX = "[EXTERNAL_API_CALL]"
+API_RESPONSE_PREFIX = "[EXTERNAL_API_RESPONSE]"
+
+
+def _tool(name, description, properties=None, required=()):
+    return {
+        "type": "function",
+        "function": {
+            "name": name,
+            "description": description,
+            "parameters": {
+                "type": "object",
+                "properties": properties or {},
+                "required": list(required),
+            },
+        },
+    }
+
+
+def _string(description, enum=None):
+    schema = {"type": "string", "description": description}
+    if enum:
+        schema["enum"] = list(enum)
+    return schema
+
+
+TOOLS = [
+    _tool("get_current_weather", "Current weather for a city. Use Minneapolis if the user names no place.",
+          {"city": _string("City name, e.g. 'New York'")}, required=["city"]),
+    _tool("get_weather_forecast",
+          "Daily weather forecast for a city, starting with today. For tomorrow request 2 days and use the second; "
+          "for a weekday, count days from today. Use Minneapolis if the user names no place.",
+          {"city": _string("City name"), "days": {"type": "integer", "description": "Number of days including today (1-7)"}},
+          required=["city", "days"]),
+    _tool("wolfram_query",
+          "WolframAlpha, for math, unit/date conversions, science and data questions you can't answer yourself. "
+          "Send a short English keyword query, e.g. 'France population' or '2*x^2 + 3*x + 4 = 7'.",
+          {"query": _string("Single-line query")}, required=["query"]),
+    _tool("get_news", "Current news headlines, optionally about a topic.",
+          {"topic": _string("Optional topic or keyword")}),
+    _tool("wikipedia_search",
+          "Search Wikipedia for something you don't know. Always follow up with wikipedia_fetch on the most relevant title "
+          "before answering.",
+          {"query": _string("Topic or question")}, required=["query"]),
+    _tool("wikipedia_fetch",
+          "Fetch a Wikipedia page found with wikipedia_search. Use 'full' when the fact is likely deep in the article.",
+          {"title": _string("Exact page title from the search results"),
+           "mode": _string("How much of the article to fetch", enum=["summary", "full"])},
+          required=["title", "mode"]),
+    _tool("calendar_search", "Search the user's calendar events by keyword.",
+          {"query": _string("Keyword, e.g. 'Production Meeting'")}, required=["query"]),
+    _tool("calendar_next_event", "The user's next upcoming event, optionally in one calendar.",
+          {"calendar_name": _string("Optional calendar name, e.g. 'Composing'")}),
+    _tool("calendar_on_date",
+          "The user's events for a natural-language date or range, e.g. 'tomorrow', 'next Wednesday', "
+          "'this week', 'next week', 'October'. Use it for any question about their schedule or availability.",
+          {"date_expr": _string("Date expression"), "calendar_name": _string("Optional calendar name")},
+          required=["date_expr"]),
+    _tool("sports",
+          "Sports schedules, games and standings. Default to 'NFL' if no team or league is named. "
+          "Use standings for records and division leaders.",
+          {"command": _string("What to look up", enum=["next_game", "schedule", "standings", "find_game"]),
+           "team_or_league": _string("Team or league, e.g. 'Vikings' or 'NFL'"),
+           "team2": _string("Second team, only for find_game")},
+          required=["command", "team_or_league"]),
+]
+
+
+# how a tool result asks for the next call, in the protocol the model was taught
+NEXT_CALL_INSTRUCTIONS = {
+    "wikipedia_fetch": {
+        "native": "call wikipedia_fetch with its exact title",
+        "text": "respond with another API call as instructed",
+    },
+}
+
+
+def next_call_instruction(tool, tool_mode):
+    """The wording a tool result uses to ask the model to call `tool` next (tool_mode "native" or "text")."""
+    return NEXT_CALL_INSTRUCTIONS[tool][tool_mode]
+
+
+def _optional(*values):
+    return [v for v in values if v]
+
+
+# tool name -> function(arguments) -> (api_type, params) for handle_api_call()
+TOOL_COMMANDS = {
+    "get_current_weather": lambda a: ("weather", [a["city"]]),
+    "get_weather_forecast": lambda a: ("forecast", [a["city"], str(a.get("days", 1))]),
+    "wolfram_query": lambda a: ("wolfram", [a["query"]]),
+    "get_news": lambda a: ("news", _optional(a.get("topic"))),
+    "wikipedia_search": lambda a: ("wikipedia", ["search", a["query"]]),
+    "wikipedia_fetch": lambda a: ("wikipedia", ["fetch", a.get("mode", "summary"), a["title"]]),
+    "calendar_search": lambda a: ("calendar_search", [a["query"]]),
+    "calendar_next_event": lambda a: ("calendar_next_event", _optional(a.get("calendar_name"))),
+    "calendar_on_date": lambda a: ("calendar_on_date", [a["date_expr"]] + _optional(a.get("calendar_name"))),
+    "sports": lambda a: ("sports", [a["command"], a["team_or_league"]] + _optional(a.get("team2"))),
+}
+
+
+class ToolCall:
+    """
+    One tool invocation requested by the model.
+    id is the provider's call id (None for calls made through the text protocol,
+    whose results go back as an [EXTERNAL_API_RESPONSE] user message).
+    """
+
+    def __init__(self, name, arguments=None, id=None, command=None):
+        self.name = name
+        self.arguments = arguments or {}
+        self.id = id
+        self._command = command
+
+    @property
+    def command(self):
+        """(api_type, params) for handle_api_call(); check error first."""
+        if self._command is not None:
+            return self._command
+        return TOOL_COMMANDS[self.name](self.arguments)
+
+    @property
+    def error(self):
+        """Why the call can't be made (unknown tool, missing argument), to send back instead of a result; else None."""
+        if self._command is not None:
+            return None
+        if self.name not in TOOL_COMMANDS:
+            return f"Unknown tool: {self.name}"
+        try:
+            self.command
+        except KeyError as e:
+            return f"{self.name} is missing the argument {e}"
+        return None
+
+    @classmethod
+    def from_text(cls, reply):
+        """Parse an '[EXTERNAL_API_CALL] <api_type> <params...>' reply, or return None."""
+        if not reply.startswith(API_CALL_PREFIX):
+            return None
+        try:
+            command = shlex.split(reply[len(API_CALL_PREFIX):].strip())  # split by space, except respect quotes
+        except ValueError:
+            command = reply[len(API_CALL_PREFIX):].split()
+        if not command:
+            return None
+        return cls(command[0].lower(), command=(command[0].lower(), command[1:]))
+
+    @classmethod
+    def parse_arguments(cls, name, arguments, id=None):
+        """Native calls: arguments arrive as a JSON string (OpenAI) or an object (Ollama)."""
+        if isinstance(arguments, str):
+            try:
+                arguments = json.loads(arguments) if arguments.strip() else {}
+            except ValueError:
+                arguments = {}
+        return cls(name, arguments, id=id)
+
+    def __repr__(self):
+        if self.error:
+            return f"{self.name} {json.dumps(self.arguments)}"
+        api_type, params = self.command
+        return f"{api_type} {' '.join(shlex.quote(p) for p in params)}".strip()
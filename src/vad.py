@@ -0,0 +1,221 @@
+import time
+import numpy as np
+
+
+class VoiceActivityDetector:
+    """Base class for per-frame speech/non-speech classifiers used for endpointing."""
+
+    def reset(self):
+        """Forget per-utterance state (long-term state such as a noise floor may be kept)."""
+        pass
+
+    def observe_noise(self, frame):
+        """
+        Feed a frame captured while idle (e.g. while waiting for the wake word). It is not part of
+        a command, but may still hold speech – the wake word itself – which must not count as noise.
+        """
+        pass
+
+    def is_speech(self, frame):
+        """frame: 1D float32 array in [-1, 1]. Returns True if the frame contains speech."""
+        raise NotImplementedError()
+
+
+class EnergyVAD(VoiceActivityDetector):
+    """The original fixed RMS threshold."""
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.last_rms = 0.0
+
+    def is_speech(self, frame):
+        self.last_rms = float(np.sqrt(np.dot(frame, frame) / len(frame))) if len(frame) else 0.0
+        return self.last_rms >= self.threshold
+
+
+class AdaptiveVAD(VoiceActivityDetector):
+    """
+    Energy-over-noise-floor detector with a zero-crossing-rate assist.
+    - The noise floor (dBFS) follows the quietest recent frames: it drops quickly
+      and rises slowly, so speech doesn't drag it up but a noisier room does.
+    - A frame is speech if it is `snr_db` above the floor, or `weak_snr_db` above it
+      with a zero-crossing rate typical of unvoiced consonants (s, f, t...),
+      so soft word endings aren't cut off.
+    - Idle audio (observe_noise) still carries the wake word and nearby talk, so frames
+      `snr_db` above the floor only count once they have lasted `sustained_noise_frames`
+      in a row – a new fan, not a voice.
+    - Speech rises and falls from syllable to syllable; steady noise doesn't. If the last
+      `floor_window` frames all count as speech but their energy stays within `flat_db`,
+      the room got louder (e.g. a fan started just before the command) and the floor
+      catches up with their quietest frame at `floor_catchup` per frame, so the command
+      can still end.
+    """
+
+    def __init__(self, snr_db=9.0, weak_snr_db=4.0, min_energy_db=-62.0,
+                 initial_floor_db=-55.0, floor_rise=0.02, floor_fall=0.3,
+                 fricative_zcr=(0.15, 0.55), sustained_noise_frames=100, floor_window=30, flat_db=3.0, floor_catchup=0.3):
+        self.snr_db = snr_db
+        self.weak_snr_db = weak_snr_db
+        self.min_energy_db = min_energy_db
+        self.floor_db = initial_floor_db
+        self.floor_rise = floor_rise
+        self.floor_fall = floor_fall
+        self.fricative_zcr = fricative_zcr
+        self.sustained_noise_frames = sustained_noise_frames  # ~3s of 512-sample frames at 16kHz
+        self._loud_frames = 0  # consecutive idle frames too loud to be background noise
+        self.flat_db = flat_db
+        self.floor_catchup = floor_catchup
+        self._recent_db = np.zeros(floor_window)  # energies of the last floor_window frames of the command (~1s)
+        self._recent_count = 0
+        self.last_energy_db = -120.0
+        self.last_zcr = 0.0
+
+    def reset(self):
+        self._recent_count = 0
+
+    def _energy_db(self, frame):
+        if len(frame) == 0:
+            return -120.0
+        self.last_energy_db = float(10.0 * np.log10(np.dot(frame, frame) / len(frame) + 1e-12))
+        return self.last_energy_db
+
+    def _features(self, frame):
+        energy_db = self._energy_db(frame)
+        # fraction of neighbouring samples that change sign
+        self.last_zcr = float(np.count_nonzero(np.signbit(frame[1:]) != np.signbit(frame[:-1])) / max(len(frame), 1))
+        return energy_db, self.last_zcr
+
+    def _track_floor(self, energy_db):
+        rate = self.floor_fall if energy_db < self.floor_db else self.floor_rise
+        self.floor_db += rate * (energy_db - self.floor_db)
+
+    def observe_noise(self, frame):
+        energy_db = self._energy_db(frame)
+        if energy_db - self.floor_db >= self.snr_db:
+            self._loud_frames += 1
+            if self._loud_frames < self.sustained_noise_frames:
+                return  # probably speech (e.g. the wake word itself): leave the floor alone
+        else:
+            self._loud_frames = 0
+        self._track_floor(energy_db)
+
+    def is_speech(self, frame):
+        energy_db, zcr = self._features(frame)
+        snr = energy_db - self.floor_db
+
+        speech = energy_db > self.min_energy_db and (
+            snr >= self.snr_db
+            or (snr >= self.weak_snr_db and self.fricative_zcr[0] <= zcr <= self.fricative_zcr[1])
+        )
+
+        self._recent_db[self._recent_count % len(self._recent_db)] = energy_db
+        self._recent_count += 1
+
+        # only let non-speech frames move the floor up; quieter frames always pull it down
+        if not speech or energy_db < self.floor_db:
+            self._track_floor(energy_db)
+        elif self._recent_count >= len(self._recent_db) and self._recent_db.std() < self.flat_db:
+            quietest = float(self._recent_db.min())
+            if quietest > self.floor_db:
+                self.floor_db += self.floor_catchup * (quietest - self.floor_db)
+        return speech
+
+
+class Endpointer:
+    """
+    Turns per-frame VAD decisions into a start/end-of-utterance decision.
+    - min_speech: seconds of speech needed before we consider the user to be talking
+    - end_silence: hangover – seconds of non-speech after speech that end the utterance
+    - no_speech_timeout: give up if no speech starts within this many seconds
+    After each utterance `last_stats` holds the timings for tuning.
+    """
+
+    def __init__(self, vad, fs=16000, frame_length=512, min_speech=0.1,
+                 end_silence=0.5, no_speech_timeout=4.0):
+        self.vad = vad
+        self.fs = fs
+        self.frame_length = frame_length
+        frame_sec = frame_length / fs
+        self.min_speech_frames = max(1, round(min_speech / frame_sec))
+        self.hangover_frames = max(1, round(end_silence / frame_sec))
+        self.no_speech_frames = max(1, round(no_speech_timeout / frame_sec))
+        self.last_stats = None
+        self.start()
+
+    def start(self):
+        self.vad.reset()
+        self.frames = 0
+        self.speech_run = 0
+        self.silence_run = 0
+        self.in_speech = False
+        self.speech_start_frame = None
+        self.last_speech_frame = None
+        self.reason = None
+        self._wall_start = time.time()
+
+    def _seconds(self, frames):
+        return frames * self.frame_length / self.fs
+
+    def process(self, frame):
+        """Feed one frame. Returns True once the utterance has ended."""
+        self.frames += 1
+        speech = self.vad.is_speech(frame)
+
+        if speech:
+            self.speech_run += 1
+            self.silence_run = 0
+            if not self.in_speech and self.speech_run >= self.min_speech_frames:
+                self.in_speech = True
+                self.speech_start_frame = self.frames - self.speech_run
+            if self.in_speech:
+                self.last_speech_frame = self.frames
+        else:
+            self.speech_run = 0
+            self.silence_run += 1
+
+        if self.in_speech and self.silence_run >= self.hangover_frames:
+            return self._finish("silence")
+        if not self.in_speech and self.frames >= self.no_speech_frames:
+            return self._finish("no_speech")
+        return False
+
+    def finish(self, reason):
+        """End the utterance for an external reason (e.g. max duration reached)."""
+        if self.reason is None:
+            self._finish(reason)
+
+    def _finish(self, reason):
+        self.reason = reason
+        endpoint = self._seconds(self.frames)
+        speech_end = self._seconds(self.last_speech_frame) if self.last_speech_frame is not None else None
+        self.last_stats = {
+            "reason": reason,
+            "speech_start": self._seconds(self.speech_start_frame) if self.speech_start_frame is not None else None,
+            "speech_end": speech_end,
+            "endpoint": endpoint,
+            # audio time between the last speech frame and the decision
+            "endpoint_latency": endpoint - speech_end if speech_end is not None else None,
+            "wall_time": time.time() - self._wall_start,
+            "noise_floor_db": getattr(self.vad, "floor_db", None),
+        }
+        return True
+
+
+def create_endpointer(mode, fs=16000, frame_length=512, silence_threshold=None,
+                      silence_duration=0.8, end_silence=0.5, no_speech_timeout=4.0):
+    """
+    Build the endpointing stage from config.
+    - "adaptive": AdaptiveVAD with hangover end_silence
+    - "energy": the original fixed-RMS behaviour (silence_threshold / silence_duration)
+    """
+    if mode == "adaptive":
+        return Endpointer(AdaptiveVAD(), fs=fs, frame_length=frame_length,
+                          end_silence=end_silence, no_speech_timeout=no_speech_timeout)
+    elif mode == "energy":
+        if silence_threshold is None:
+            raise ValueError("VAD_MODE=energy requires SILENCE_THRESHOLD")
+        # the old recorder stopped after silence_duration whether or not anyone spoke
+        return Endpointer(EnergyVAD(silence_threshold), fs=fs, frame_length=frame_length, min_speech=0,
+                          end_silence=silence_duration, no_speech_timeout=silence_duration)
+    else:
+        raise ValueError(f"Unknown VAD_MODE: {mode}")
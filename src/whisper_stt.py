@@ -1,15 +1,59 @@
 import os
+import io
+import time
+import logging
+import platform
 import numpy as np
+import torch
+import torch.nn.functional as F
 import whisper
+from whisper.decoding import DecodingTask, DecodingOptions
 import openai
+import httpx
+import soundfile as sf
 from dotenv import load_dotenv
 from speech_to_text import SpeechToText
+from model_cache import load_whisper
 
 load_dotenv()
 
+logger = logging.getLogger('HAL')
+
 TRANSCRIPTION_BACKEND = os.getenv("TRANSCRIPTION_BACKEND", "local").lower()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 WHISPER_MODEL_NAME = os.getenv("WHISPER_MODEL_NAME", "base")
+STT_UPLOAD_FORMAT = os.getenv("STT_UPLOAD_FORMAT", "wav").lower() # "wav" or "flac" (lossless, roughly half the upload size)
+WHISPER_SHORT_MODE = os.getenv("WHISPER_SHORT_MODE", "True") == "True" # encode only the real audio instead of a padded 30s window
+WHISPER_DECODE_PROFILE = os.getenv("WHISPER_DECODE_PROFILE", "balanced").lower() # see DECODE_PROFILES
+WHISPER_LANGUAGE = os.getenv("WHISPER_LANGUAGE") # overrides the profile's language; "auto" = detect on every call
+WHISPER_THREADS = int(os.getenv("WHISPER_THREADS")) if os.getenv("WHISPER_THREADS") else None # overrides the profile's thread count
+
+CPU_COUNT = os.cpu_count() or 1
+
+def _threads(cap):
+    # one core is left for the capture, wake word and VAD threads, which keep running while we transcribe;
+    # past a few threads the small models' matrices are too small to gain from more
+    return max(1, min(cap, CPU_COUNT - 1))
+
+# Local decoding settings, from lowest latency to best accuracy.
+# - language: None detects the language on every call (an extra encoder+decoder pass)
+# - beam_size: None is greedy decoding
+# - temperature: fallback ladder tried when a decode looks like a hallucination; (0.0,) never retries
+# - threads: torch intra-op threads (fast: up to 4, balanced: up to 6, one core always left free),
+#   None = one per core; WHISPER_THREADS overrides it
+DECODE_PROFILES = {
+    "fast": {"language": "en", "beam_size": None, "best_of": None, "temperature": (0.0,), "threads": _threads(4)},
+    "balanced": {"language": "en", "beam_size": None, "best_of": 2, "temperature": (0.0, 0.4, 0.8), "threads": _threads(6)},
+    "accurate": {"language": None, "beam_size": 5, "best_of": 5, "temperature": (0.0, 0.2, 0.4, 0.6, 0.8, 1.0), "threads": None},
+}
+
+SHORT_MODE_MAX_SECONDS = 25.0 # longer audio goes through the regular 30s-window path
+SHORT_MODE_MARGIN = 0.2 # seconds of silence kept around the trimmed speech
+SHORT_MODE_TOKENS_PER_SECOND = 8 # decoding cap; normal speech is ~3-4 tokens/s
+# a decode that crosses either threshold is retried at the next temperature (as whisper.transcribe does)
+COMPRESSION_RATIO_THRESHOLD = 2.4
+LOGPROB_THRESHOLD = -1.0
+NO_SPEECH_THRESHOLD = 0.6
 
 class WhisperSTT(SpeechToText):
     def __init__(self, model_name=None):
@@ -17,24 +61,61 @@ class WhisperSTT(SpeechToText):
         self.model_name = model_name or WHISPER_MODEL_NAME
         self.model = None
 
+        self.last_rtf = None  # processing time / audio duration of the last transcription
+        self.last_timing = None  # API backend: encode / upload / response seconds of the last request
+
         if self.backend == "local":
-            self.model = whisper.load_model(self.model_name)
+            self._apply_profile(WHISPER_DECODE_PROFILE)
+            self.model = load_whisper(self.model_name, device="cuda" if torch.cuda.is_available() else "cpu")
 
         elif self.backend == "api":
             if not OPENAI_API_KEY:
                 raise RuntimeError("OPENAI_API_KEY not set but TRANSCRIPTION_BACKEND=api")
-            self.client = openai.OpenAI(api_key=OPENAI_API_KEY)
+            if STT_UPLOAD_FORMAT not in UPLOAD_FORMATS:
+                raise ValueError(f"Unknown STT_UPLOAD_FORMAT: {STT_UPLOAD_FORMAT}")
+            # one keep-alive connection pool for the whole session, so each command skips the TCP/TLS handshake
+            self.http_client = httpx.Client(
+                timeout=httpx.Timeout(30.0, connect=5.0),
+                limits=httpx.Limits(max_keepalive_connections=2, keepalive_expiry=300),
+            )
+            self.client = openai.OpenAI(api_key=OPENAI_API_KEY, http_client=self.http_client)
 
         else:
             raise ValueError(f"Unknown TRANSCRIPTION_BACKEND: {self.backend}")
 
-    def transcribe(self, audio_data, fs=16000):
+    def _apply_profile(self, name):
+        if name not in DECODE_PROFILES:
+            raise ValueError(f"Unknown WHISPER_DECODE_PROFILE: {name} (expected one of {', '.join(DECODE_PROFILES)})")
+        self.profile = dict(DECODE_PROFILES[name], name=name)
+        if WHISPER_LANGUAGE:
+            self.profile["language"] = None if WHISPER_LANGUAGE.lower() == "auto" else WHISPER_LANGUAGE
+        if WHISPER_THREADS:
+            self.profile["threads"] = WHISPER_THREADS
+        torch.set_num_threads(self.profile["threads"] or CPU_COUNT)
+        logger.info(f"Whisper decode profile '{name}': language {self.profile['language'] or 'auto'}, "
+                    f"{'beam ' + str(self.profile['beam_size']) if self.profile['beam_size'] else 'greedy'}, "
+                    f"temperatures {self.profile['temperature']} (best of {self.profile['best_of'] or 1} when sampling), "
+                    f"{torch.get_num_threads()} threads, short mode {'on' if WHISPER_SHORT_MODE else 'off'}")
+
+    def transcribe(self, audio_data, fs=16000, prompt=None):
         """
         audio_data: 1D numpy array float32, fs sample rate
+        prompt: optional text preceding this audio (e.g. earlier segments of the same command)
         Returns: text transcription
         """
+        start = time.time()
+        text = self._transcribe(audio_data, fs, prompt)
+        self._report_rtf(time.time() - start, len(audio_data) / fs)
+        return text
 
-        if self.backend == "local":
+    def _report_rtf(self, elapsed, duration):
+        if duration <= 0:
+            return
+        self.last_rtf = elapsed / duration
+        logger.info(f"Transcribed {duration:.2f}s of audio in {elapsed:.2f}s ({self.backend}, {self.model_name}, RTF {self.last_rtf:.2f})")
+
+    def _transcribe(self, audio_data, fs, prompt):
+        if self.backend in ("local", "local_int8"):
             # Normalize
             max_val = np.max(np.abs(audio_data))
             if max_val > 0:
@@ -42,23 +123,208 @@ class WhisperSTT(SpeechToText):
             else:
                 audio_data = np.zeros_like(audio_data)
 
+            if WHISPER_SHORT_MODE and len(audio_data) <= SHORT_MODE_MAX_SECONDS * whisper.audio.SAMPLE_RATE:
+                return transcribe_short(self.model, audio_data, prompt=prompt, profile=self.profile)
+
             audio_data = whisper.pad_or_trim(audio_data)
-            result = self.model.transcribe(audio_data, fp16=False)
+            result = self.model.transcribe(
+                audio_data,
+                fp16=False,
+                initial_prompt=prompt,
+                language=self.profile["language"],
+                beam_size=self.profile["beam_size"],
+                best_of=self.profile["best_of"],
+                temperature=self.profile["temperature"],
+            )
             return result["text"]
 
         elif self.backend == "api":
-            # Save temp wav for upload
-            import tempfile, soundfile as sf
-
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp:
-                sf.write(tmp.name, audio_data, fs, subtype="PCM_16")
-                tmp_path = tmp.name
+            # encode in memory – nothing touches the SD card
+            start = time.time()
+            fmt, mime = STT_UPLOAD_FORMAT, UPLOAD_FORMATS[STT_UPLOAD_FORMAT]
+            upload = _TimedUpload()
+            sf.write(upload, audio_data, fs, format=fmt.upper(), subtype="PCM_16")
+            size = upload.getbuffer().nbytes  # not tell(): FLAC seeks back to finish its header
+            upload.seek(0)
+            encoded = time.time()
 
-            with open(tmp_path, "rb") as f:
-                transcript = self.client.audio.transcriptions.create(
-                    model="gpt-4o-mini-transcribe",
-                    file=f
-                )
+            transcript = self.client.audio.transcriptions.create(
+                model="gpt-4o-mini-transcribe",
+                file=(f"command.{fmt}", upload, mime),
+                **({"prompt": prompt} if prompt else {})
+            )
+            done = time.time()
 
-            os.remove(tmp_path)
+            # upload ends when the request body has been read out; the rest is waiting for the answer
+            uploaded = upload.finished or done
+            self.last_timing = {
+                "format": fmt,
+                "bytes": size,
+                "encode": encoded - start,
+                "upload": uploaded - encoded,
+                "response": done - uploaded,
+            }
+            logger.info(f"STT API: {size/1024:.0f} KiB {fmt}, encode {self.last_timing['encode']*1000:.0f}ms, "
+                        f"upload {self.last_timing['upload']*1000:.0f}ms, response {self.last_timing['response']*1000:.0f}ms")
             return transcript.text
+
+
+UPLOAD_FORMATS = {"wav": "audio/wav", "flac": "audio/flac"}
+
+
+class _TimedUpload(io.BytesIO):
+    """In-memory upload body that records when the HTTP client finished reading it."""
+
+    finished = None
+
+    def read(self, size=-1):
+        data = super().read(size)
+        if not data and self.finished is None and self.tell() > 0:
+            self.finished = time.time()
+        return data
+
+
+# ------------------------------------------------------------
+# Short-utterance mode
+# ------------------------------------------------------------
+def trim_silence(audio, fs=16000, margin=SHORT_MODE_MARGIN, threshold_db=-35.0):
+    """
+    Drop leading/trailing audio quieter than threshold_db relative to the loudest 10ms frame,
+    keeping `margin` seconds either side. Returns a view of `audio`.
+    """
+    hop = fs // 100
+    n = len(audio) // hop
+    if n == 0:
+        return audio
+    rms = np.sqrt(np.mean(np.square(audio[:n * hop].reshape(n, hop), dtype=np.float32), axis=1))
+    peak = rms.max()
+    if peak <= 0:
+        return audio[:0]
+    loud = np.flatnonzero(rms >= peak * 10 ** (threshold_db / 20))
+    pad = int(margin * fs)
+    return audio[max(0, loud[0] * hop - pad):min(len(audio), (loud[-1] + 1) * hop + pad)]
+
+
+class _ShortAudioDecodingTask(DecodingTask):
+    """DecodingTask whose audio encoder runs on the real audio length instead of a 30s window."""
+
+    def _get_audio_features(self, mel):
+        with torch.no_grad():
+            return encode_variable_length(self.model.encoder, mel)
+
+
+def encode_variable_length(encoder, mel):
+    """
+    whisper's AudioEncoder.forward, minus the assertion that the input is exactly 30s:
+    the positional embedding is sliced to the number of audio frames instead.
+    """
+    x = F.gelu(encoder.conv1(mel))
+    x = F.gelu(encoder.conv2(x))
+    x = x.permute(0, 2, 1)
+    x = (x + encoder.positional_embedding[:x.shape[1]]).to(x.dtype)
+    for block in encoder.blocks:
+        x = block(x)
+    return encoder.ln_post(x)
+
+
+def transcribe_short(model, audio, prompt=None, profile=None):
+    """
+    Transcribe a short command without padding it to 30s:
+    trims surrounding silence, encodes only the remaining audio and caps the number
+    of decoded tokens by its duration. audio: float32 at 16kHz.
+    The profile is honoured as in the regular path: language detection (which needs
+    a padded 30s window, so it costs a full encode) and the temperature fallback.
+    """
+    profile = profile or DECODE_PROFILES["fast"]
+    fs = whisper.audio.SAMPLE_RATE
+    audio = trim_silence(audio, fs)
+    if len(audio) < fs // 10:
+        return ""
+
+    # the encoder's second conv has stride 2: keep an even number of 10ms mel frames
+    hop = whisper.audio.HOP_LENGTH * 2
+    padded = np.zeros(-(-len(audio) // hop) * hop, dtype=np.float32)
+    padded[:len(audio)] = audio
+    mel = whisper.log_mel_spectrogram(padded, n_mels=model.dims.n_mels).to(model.device)
+
+    language = profile["language"] if model.is_multilingual else "en"
+    if language is None:
+        full_mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), n_mels=model.dims.n_mels).to(model.device)
+        _, probs = model.detect_language(full_mel)
+        language = max(probs, key=probs.get)
+        logger.debug(f"Detected language: {language} ({probs[language]:.2f})")
+
+    options = {
+        "language": language,
+        "prompt": prompt,
+        "fp16": False,
+        "without_timestamps": True,
+        "sample_len": max(16, int(len(audio) / fs * SHORT_MODE_TOKENS_PER_SECOND)),
+    }
+    result = decode_with_fallback(model, mel.unsqueeze(0), options, profile)
+    if result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob < LOGPROB_THRESHOLD:
+        return ""  # whisper.transcribe drops such segments too
+    return result.text
+
+
+def decode_with_fallback(model, mel, options, profile):
+    """
+    Short-mode counterpart of whisper.transcribe's fallback: decode at each of the profile's
+    temperatures in turn until the result doesn't look like a hallucination (repetitive or
+    improbable). Beam search at temperature 0, best_of samples above it.
+    """
+    result = None
+    for temperature in profile["temperature"]:
+        if temperature > 0:
+            decode_options = dict(options, temperature=temperature, best_of=profile["best_of"])
+        else:
+            decode_options = dict(options, temperature=temperature, beam_size=profile["beam_size"])
+        result = _ShortAudioDecodingTask(model, DecodingOptions(**decode_options)).run(mel)[0]
+
+        if result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob < LOGPROB_THRESHOLD:
+            break  # silence: retrying won't help
+        if result.compression_ratio <= COMPRESSION_RATIO_THRESHOLD and result.avg_logprob >= LOGPROB_THRESHOLD:
+            break
+        logger.debug(f"Whisper decode at temperature {temperature} rejected "
+                     f"(compression {result.compression_ratio:.2f}, logprob {result.avg_logprob:.2f})")
+    return result
+
+
+class QuantizedWhisperSTT(WhisperSTT):
+    """
+    Local Whisper with int8 weights (TRANSCRIPTION_BACKEND=local_int8).
+    Every linear layer (attention projections and MLPs, most of the model's
+    compute) is replaced by a dynamically quantized int8 layer; convolutions
+    and embeddings stay float32. CPU only.
+    """
+
+    def __init__(self, model_name=None):
+        self.backend = "local_int8"
+        self.model_name = model_name or WHISPER_MODEL_NAME
+        self.last_rtf = None
+
+        # on ARM (e.g. Pi 5) the qnnpack kernels are the fast ones
+        if platform.machine() in ("aarch64", "arm64") and "qnnpack" in torch.backends.quantized.supported_engines:
+            torch.backends.quantized.engine = "qnnpack"
+
+        self._apply_profile(WHISPER_DECODE_PROFILE)
+        start = time.time()
+        model = load_whisper(self.model_name, device="cpu")
+        self.model = quantize_whisper(model)
+        logger.info(f"Loaded int8 Whisper '{self.model_name}' in {time.time() - start:.2f}s "
+                    f"(quantized engine: {torch.backends.quantized.engine})")
+
+
+def quantize_whisper(model):
+    """Return `model` with its linear layers dynamically quantized to int8."""
+    # whisper.model.Linear is a thin nn.Linear subclass, which quantize_dynamic won't swap;
+    # swap it for a plain nn.Linear sharing the same weights first
+    for parent in list(model.modules()):
+        for name, child in parent.named_children():
+            if isinstance(child, whisper.model.Linear):
+                linear = torch.nn.Linear(child.in_features, child.out_features, bias=child.bias is not None)
+                linear.weight = child.weight
+                linear.bias = child.bias
+                setattr(parent, name, linear)
+    model.eval()
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)